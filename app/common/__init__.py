@@ -1,7 +1,15 @@
+from .metrics import Metrics, metrics
+from .supervisor import Shard, Supervisor
 from .task_queue import TaskQueue
 from ._task import Task
 from .data_transformer import DataTransformer
 from .lark_queue import LarkQueue
 from ._logger import Logger
+from .attachment_cache import AttachmentCache
+from .workspace import Workspace, WorkspaceFull, WorkspaceManager
 from .context import AppContext
 from .worker import Worker
+from .lease_manager import LeaseManager
+from .poll_scheduler import PollScheduler
+from .retry_scheduler import RetryScheduler, TRANSIENT_ERRORS
+from .executor import TaskExecutor
@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Dict, Any
 from datetime import datetime
 from uuid import uuid4
@@ -7,10 +7,14 @@ from uuid import uuid4
 class Task:
     payload: Dict[str, Any]
     type: str
-    uuid: str = uuid4()
+    uuid: str = field(default_factory=lambda: str(uuid4()))
     failed_at: datetime = None
     no_of_retries: int = 0
-    
+
+    @property
+    def record_id(self):
+        return self.payload.get('record_id')
+
     def increment_retry(self):
         self.no_of_retries += 1
 
@@ -0,0 +1,122 @@
+import asyncio
+import os
+import shutil
+from collections import OrderedDict
+from threading import RLock
+from app.src.lark import BitableManager
+from .metrics import metrics
+
+
+class AttachmentCache:
+    """On-disk cache of Lark attachments keyed by file_token.
+
+    A file_token always names the same content, so a cached file never goes
+    stale; a new upload gets a new token and misses. Downloads stream into a
+    temporary file that is renamed in place, so a cached file is always
+    complete. Files are evicted least recently used first once the cache
+    grows past max_bytes. Hits and misses are counted in metrics as
+    attachment_cache.hits / attachment_cache.misses.
+
+    The folder belongs to one process: it is scanned on first use, removing
+    downloads a crashed run left behind, and sharded workers point folder at
+    a subfolder of their own.
+    """
+
+    def __init__(self, base_manager: BitableManager, folder: str = os.path.join('storage', 'attachments'),
+                 max_bytes: int = 1 << 30):
+        self.base_manager = base_manager
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._lock = RLock()
+        # file_token -> size, least recently used first
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._size = 0
+        self._loaded = False
+
+    def _load(self) -> None:
+        with self._lock:
+            if self._loaded:
+                return
+            self._scan()
+            self._loaded = True
+
+    def _scan(self) -> None:
+        os.makedirs(self.folder, exist_ok=True)
+        files = []
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            if not os.path.isfile(path):
+                # the per-shard caches of sharded workers
+                continue
+            if name.endswith('.part'):
+                # left behind by a download that never finished
+                os.remove(path)
+                continue
+            stat = os.stat(path)
+            files.append((stat.st_mtime, name, stat.st_size))
+
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._size += size
+        metrics.set_gauge('attachment_cache.bytes', self._size)
+
+    def path_of(self, file_token: str) -> str:
+        return os.path.join(self.folder, file_token)
+
+    def _touch(self, file_token: str) -> bool:
+        with self._lock:
+            if file_token not in self._entries or not os.path.exists(self.path_of(file_token)):
+                self._size -= self._entries.pop(file_token, 0)
+                return False
+            self._entries.move_to_end(file_token)
+        # mtime keeps the LRU order across restarts
+        os.utime(self.path_of(file_token))
+        return True
+
+    def _add(self, file_token: str, size: int) -> None:
+        with self._lock:
+            self._size += size - self._entries.pop(file_token, 0)
+            self._entries[file_token] = size
+
+            # never evict the file that was just fetched
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                oldest, oldest_size = self._entries.popitem(last=False)
+                self._size -= oldest_size
+                try:
+                    os.remove(self.path_of(oldest))
+                except FileNotFoundError:
+                    pass
+                metrics.increment('attachment_cache.evictions')
+
+            metrics.set_gauge('attachment_cache.bytes', self._size)
+
+    async def get(self, file_token: str, record_id: str) -> str:
+        """path of the cached attachment, downloaded first on a miss"""
+        self._load()
+        if self._touch(file_token):
+            metrics.increment('attachment_cache.hits')
+            return self.path_of(file_token)
+
+        metrics.increment('attachment_cache.misses')
+        size, _ = await self.base_manager.download_media_to_file(
+            file_token,
+            BitableManager.media_extra(record_id=record_id, file_token=file_token),
+            self.path_of(file_token)
+        )
+        self._add(file_token, size)
+        return self.path_of(file_token)
+
+    async def copy_to(self, file_token: str, record_id: str, destination: str) -> str:
+        """put a private copy of the attachment at destination, handlers may modify it freely"""
+        folder = os.path.dirname(destination)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        source = await self.get(file_token, record_id)
+        try:
+            await asyncio.to_thread(shutil.copyfile, source, destination)
+        except FileNotFoundError:
+            # evicted by a concurrent miss between get() and the copy, fetch it once more
+            source = await self.get(file_token, record_id)
+            await asyncio.to_thread(shutil.copyfile, source, destination)
+        return destination
@@ -1,16 +1,21 @@
 import logging
 import os
-from app.services import ExcelReader, GroqService
-from app.src.lark import BitableManager, FileManager
+from app.services import GroqService, HttpClient
+from app.src.lark import BitableManager, FileManager, RecordUpdateBuffer
 from app.common import TaskQueue , LarkQueue
 from app.stores import Stores
+from .attachment_cache import AttachmentCache
+from .workspace import WorkspaceManager
 
 class AppContext:
     def __init__(
         self,
         base_manager: BitableManager,
         file_manager: FileManager,
-        excel_reader: ExcelReader,
+        record_updates: RecordUpdateBuffer,
+        http_client: HttpClient,
+        attachment_cache: AttachmentCache,
+        workspaces: WorkspaceManager,
         lark_queue: LarkQueue,
         task_queue: TaskQueue,
         stores: Stores,
@@ -21,7 +26,10 @@ class AppContext:
     ):
         self.base_manager = base_manager
         self.file_manager = file_manager
-        self.excel_reader = excel_reader
+        self.record_updates = record_updates
+        self.http_client = http_client
+        self.attachment_cache = attachment_cache
+        self.workspaces = workspaces
         self.lark_queue = lark_queue
         self.task_queue = task_queue
         self.stores = stores
@@ -1,8 +1,49 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterable, List
 from lark_oapi.api.bitable.v1 import AppTableRecord
 
 
 class DataTransformer:
+    # columns of an Unprocessed record kept in a task payload, per assessment type
+    CONTENT_GENERATOR_COLUMNS = [
+        "record_id",
+        "version",
+        "assessment_type",
+        "environment",
+        "youtube_link",
+        "status",
+        "date_uploaded",
+        "uploaded_by",
+        "no_of_retries"
+    ]
+    FILE_COLUMNS = [
+        "record_id",
+        "version",
+        "assessment_type",
+        "environment",
+        "file",
+        "download_url",
+        "status",
+        "date",
+        "uploaded_by",
+        "no_of_retries"
+    ]
+
+    @staticmethod
+    def columns_for(assessment_type: str) -> List[str]:
+        if assessment_type == "Content Generator":
+            return DataTransformer.CONTENT_GENERATOR_COLUMNS
+        return DataTransformer.FILE_COLUMNS
+
+    @staticmethod
+    def field_names(*column_lists: Iterable[str]) -> List[str]:
+        """Lark field projection for the given column lists, record_id is not a field"""
+        names = []
+        for columns in column_lists:
+            for column in columns:
+                if column != "record_id" and column not in names:
+                    names.append(column)
+        return names
+
     @staticmethod
     def select_keys(payload: Dict[str, Any], columns: List[str]):
         """select keys to extract from dictionary input"""
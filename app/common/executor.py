@@ -0,0 +1,170 @@
+import asyncio
+import logging
+from typing import Dict, Optional, Set
+from app.interfaces import CallbackHandler
+from ._task import Task
+from .task_queue import TaskQueue
+from .lease_manager import LeaseManager
+from .retry_scheduler import RetryScheduler
+
+logger = logging.getLogger()
+
+
+class TaskExecutor:
+    """Runs task handlers in the background with a bounded number of in-flight tasks per assessment type.
+
+    Every assessment type has its own pool of `limits[type]` slots. total_limit
+    optionally caps all pools together, so when it is lower than the sum of the
+    pools, slots left idle by one type can be used by another.
+    """
+
+    def __init__(
+        self,
+        handlers: Dict[str, CallbackHandler],
+        limits: Optional[Dict[str, int]] = None,
+        default_limit: int = 4,
+        total_limit: Optional[int] = None,
+        task_timeout: Optional[float] = None,
+        task_queue: Optional[TaskQueue] = None,
+        lease_manager: Optional[LeaseManager] = None,
+        retry_scheduler: Optional[RetryScheduler] = None
+    ):
+        self.handlers = handlers
+        self.limits = limits or {}
+        self.default_limit = default_limit
+        self.total_limit = total_limit
+        self.task_timeout = task_timeout
+        self.task_queue = task_queue
+        self.lease_manager = lease_manager
+        self.retry_scheduler = retry_scheduler
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._running: Set[asyncio.Task] = set()
+
+    def _get_semaphore(self, assessment_type: str) -> asyncio.Semaphore:
+        if assessment_type not in self._semaphores:
+            limit = self.limits.get(assessment_type, self.default_limit)
+            self._semaphores[assessment_type] = asyncio.Semaphore(max(1, limit))
+        return self._semaphores[assessment_type]
+
+    def _at_total_limit(self) -> bool:
+        return self.total_limit is not None and len(self._running) >= self.total_limit
+
+    def has_capacity(self, assessment_type: str) -> bool:
+        return not self._get_semaphore(assessment_type).locked() and not self._at_total_limit()
+
+    def in_flight(self) -> int:
+        return len(self._running)
+
+    async def submit(self, task: Task) -> asyncio.Task:
+        """wait for a free slot for the task type, then run its handler in the background"""
+        if task.type not in self.handlers:
+            raise KeyError(f"no handler registered for assessment type: {task.type}")
+
+        while self._at_total_limit():
+            await self.wait_for_any()
+
+        semaphore = self._get_semaphore(task.type)
+        await semaphore.acquire()
+
+        try:
+            running = asyncio.create_task(
+                self._run(task, semaphore),
+                name=f"{task.type}:{task.payload.get('record_id')}"
+            )
+        except BaseException:
+            semaphore.release()
+            raise
+
+        self._running.add(running)
+        running.add_done_callback(self._running.discard)
+
+        return running
+
+    async def _run(self, task: Task, semaphore: asyncio.Semaphore):
+        record_id = task.payload.get('record_id')
+        keep_alive = None
+        finished = False
+        cancelled = False
+        error: Optional[BaseException] = None
+        try:
+            if self.lease_manager is not None:
+                if not await self.lease_manager.claim(record_id):
+                    logger.info('record %s is claimed by another worker or already settled, skipping', record_id)
+                    finished = True
+                    return
+                keep_alive = asyncio.create_task(self.lease_manager.keep_alive(record_id))
+
+            await asyncio.wait_for(
+                self.handlers[task.type].handler(task.payload),
+                timeout=self.task_timeout
+            )
+            finished = True
+        except asyncio.TimeoutError as err:
+            logger.error('task %s (%s) timed out after %ss', record_id, task.type, self.task_timeout)
+            error = err
+        except asyncio.CancelledError:
+            logger.warning('task %s (%s) was cancelled', record_id, task.type)
+            cancelled = True
+            raise
+        except Exception as err:
+            logger.error('task %s (%s) failed: %s', record_id, task.type, err)
+            error = err
+        finally:
+            if keep_alive is not None:
+                keep_alive.cancel()
+            semaphore.release()
+            await self._settle(task, error, cancelled, claimed=keep_alive is not None and not finished)
+
+    async def _settle(self, task: Task, error: Optional[BaseException], cancelled: bool, claimed: bool) -> None:
+        """ack, requeue or schedule a retry for a task that left the executor, and settle its lease"""
+        record_id = task.payload.get('record_id')
+        if error is not None and not cancelled and self.retry_scheduler is not None and self.task_queue is not None:
+            due_at = self.retry_scheduler.schedule(task, error)
+            if claimed and due_at is not None:
+                # other replicas keep away until the retry is due, the retry itself re-claims its own lease
+                await self.lease_manager.hold(record_id, until=due_at, no_of_retries=task.no_of_retries)
+            # with no retries left the scheduler writes failed over the lease and acks the task after
+            return
+
+        if claimed:
+            await self.lease_manager.release(record_id)
+
+        if self.task_queue is None:
+            return
+
+        if cancelled:
+            # unfinished work goes back to the queue for the next run
+            self.task_queue.nack(task)
+        else:
+            self.task_queue.ack(task)
+
+    async def wait_for_any(self, timeout: Optional[float] = None) -> None:
+        """block until at least one in-flight task finishes"""
+        if not self._running:
+            return
+        await asyncio.wait(set(self._running), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+    async def join(self, timeout: Optional[float] = None) -> Set[asyncio.Task]:
+        """wait for in-flight tasks to finish, returns the ones still running after the timeout"""
+        if not self._running:
+            return set()
+        _, pending = await asyncio.wait(set(self._running), timeout=timeout)
+        return pending
+
+    async def shutdown(self, drain_timeout: float) -> None:
+        """wait up to drain_timeout for running tasks, then cancel the rest so they are requeued"""
+        if not self._running:
+            return
+
+        logger.info('waiting up to %ss for %s running tasks...', drain_timeout, len(self._running))
+        pending = await self.join(timeout=drain_timeout)
+
+        if pending:
+            logger.warning('%s tasks did not finish in time, requeueing them', len(pending))
+            await self.cancel_all()
+
+    async def cancel_all(self) -> None:
+        running = set(self._running)
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
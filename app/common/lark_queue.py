@@ -1,22 +1,142 @@
+import logging
+import time
 from app.src.lark import BitableManager
 from lark_oapi.api.bitable.v1 import AppTableRecord
-from typing import List
-from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Optional, Union
+from dataclasses import dataclass, field
+
+logger = logging.getLogger()
+
 
 @dataclass
 class LarkQueue:
+    """Finds claimable records in the Unprocessed table.
+
+    By default every get_items call runs the full claimable filter. With
+    incremental set, LarkQueue keeps a local mirror of the candidate records
+    (unclaimed or processing) and only fetches records whose modified_field
+    changed since the last sync, minus an overlap for clock skew. Whether a
+    record is claimable, including lease expiry, is then decided locally.
+    A full reconcile replaces the mirror every reconcile_interval seconds to
+    catch deleted records and anything the change feed missed.
+    """
     base_manager: BitableManager
     bitable_table_id: str
     version: str
     environment: str
+    max_retries: int = 3
+    incremental: bool = False
+    # a "Modified time" field of the Unprocessed table, in epoch ms
+    modified_field: str = "last_modified_time"
+    reconcile_interval: float = 600.0
+    overlap_ms: int = 60_000
+    _mirror: Dict[str, AppTableRecord] = field(default_factory=dict, repr=False)
+    _mirror_tasks: Optional[FrozenSet[str]] = field(default=None, repr=False)
+    _high_water_mark: int = field(default=0, repr=False)
+    _reconciled_at: float = field(default=0.0, repr=False)
+
+    def _scope(self, server_tasks: List[str]) -> str:
+        assessment_types = [f"CurrentValue.[assessment_type] = \"{server_task}\"" for server_task in server_tasks]
+        assessment_type = assessment_types[0] if len(assessment_types) == 1 else f"OR({', '.join(assessment_types)})"
+        return f"AND(AND(CurrentValue.[version] = \"{self.version}\", CurrentValue.[environment] = \"{self.environment.upper()}\"), {assessment_type})"
+
+    def _projection(self, field_names: Optional[List[str]]) -> Optional[List[str]]:
+        """the caller's fields plus the ones LarkQueue itself filters on"""
+        if not field_names:
+            return None
+        required = ["assessment_type", "status", "no_of_retries", "lease_expires_at"]
+        if self.incremental:
+            required.append(self.modified_field)
+        return list(dict.fromkeys([*field_names, *required]))
+
+    async def get_items(self, server_tasks: Union[str, List[str]],
+                        field_names: Optional[List[str]] = None) -> List[AppTableRecord]:
+        """fetch claimable records of one or several assessment types in a single query.
+
+        With field_names set, records only carry those fields.
+        """
+        if isinstance(server_tasks, str):
+            server_tasks = [server_tasks]
+        field_names = self._projection(field_names)
+
+        if self.incremental:
+            return await self._get_items_incremental(server_tasks, field_names)
 
-    async def get_items(self, server_task: str) -> List[AppTableRecord]:
         # query = f"AND(AND(AND(OR(CurrentValue.[status] = \"\", CurrentValue.[status] = \"failed\"), CurrentValue.[no_of_retries] <= 3), CurrentValue.[version] = \"{self.version}\"), CurrentValue.[environment] = \"{self.environment.upper()}\")"
-        query = f"AND(AND(AND(CurrentValue.[version] = \"{self.version}\", CurrentValue.[environment] = \"{self.environment.upper()}\"), AND(CurrentValue.[status] = \"\", CurrentValue.[no_of_retries] <= 3)), CurrentValue.[assessment_type] = \"{server_task}\")"
-        records = await self.base_manager.async_get_records(
+        # unclaimed rows, plus rows whose worker let the lease expire
+        now = int(time.time() * 1000)
+        claimable = f"OR(CurrentValue.[status] = \"\", AND(CurrentValue.[status] = \"processing\", CurrentValue.[lease_expires_at] < {now}))"
+        query = f"AND({self._scope(server_tasks)}, AND({claimable}, CurrentValue.[no_of_retries] <= {self.max_retries}))"
+        records = await self.base_manager.async_get_all_records(
             table_id=self.bitable_table_id,
-            filter=query
+            filter=query,
+            field_names=field_names
         )
-        print(self.bitable_table_id)
-        
+
         return records
+
+    def _is_candidate(self, record: AppTableRecord) -> bool:
+        """unclaimed or processing records with retries left, the ones worth mirroring"""
+        fields = record.fields or {}
+        if (fields.get("status") or "") not in ("", "processing"):
+            return False
+        return int(fields.get("no_of_retries") or 0) <= self.max_retries
+
+    def _is_claimable(self, record: AppTableRecord, now: int) -> bool:
+        fields = record.fields or {}
+        if (fields.get("status") or "") == "":
+            return True
+        lease_expires_at = fields.get("lease_expires_at")
+        return lease_expires_at is not None and int(lease_expires_at) < now
+
+    def _advance(self, records: List[AppTableRecord]) -> None:
+        for record in records:
+            modified = (record.fields or {}).get(self.modified_field)
+            if modified is not None:
+                self._high_water_mark = max(self._high_water_mark, int(modified))
+
+    async def reconcile(self, server_tasks: List[str], field_names: Optional[List[str]] = None) -> None:
+        """replace the mirror with a full scan of the candidate records"""
+        started_at = int(time.time() * 1000)
+        candidates = "OR(CurrentValue.[status] = \"\", CurrentValue.[status] = \"processing\")"
+        query = f"AND({self._scope(server_tasks)}, AND({candidates}, CurrentValue.[no_of_retries] <= {self.max_retries}))"
+        records = await self.base_manager.async_get_all_records(
+            table_id=self.bitable_table_id,
+            filter=query,
+            field_names=field_names
+        )
+
+        self._mirror = {record.record_id: record for record in records}
+        self._mirror_tasks = frozenset(server_tasks)
+        # anything modified while the scan ran is picked up by the next change feed
+        self._high_water_mark = started_at
+        self._advance(records)
+        self._reconciled_at = time.monotonic()
+        logger.info('lark queue reconciled, %s candidate records', len(self._mirror))
+
+    async def _get_items_incremental(self, server_tasks: List[str],
+                                     field_names: Optional[List[str]]) -> List[AppTableRecord]:
+        if (
+            self._mirror_tasks != frozenset(server_tasks)
+            or time.monotonic() - self._reconciled_at >= self.reconcile_interval
+        ):
+            await self.reconcile(server_tasks, field_names)
+        else:
+            since = self._high_water_mark - self.overlap_ms
+            query = f"AND({self._scope(server_tasks)}, CurrentValue.[{self.modified_field}] >= {since})"
+            changed = await self.base_manager.async_get_all_records(
+                table_id=self.bitable_table_id,
+                filter=query,
+                field_names=field_names
+            )
+
+            for record in changed:
+                if self._is_candidate(record):
+                    self._mirror[record.record_id] = record
+                else:
+                    # done, failed or out of retries, a later change brings it back
+                    self._mirror.pop(record.record_id, None)
+            self._advance(changed)
+
+        now = int(time.time() * 1000)
+        return [record for record in self._mirror.values() if self._is_claimable(record, now)]
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Optional
+from uuid import uuid4
+from app.src.lark import BitableManager
+from app.enums import BubbleRecordStatus
+
+logger = logging.getLogger()
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class LeaseManager:
+    """Claims Unprocessed records for this worker so replicas never process the same row twice.
+
+    A claim writes status "processing", the worker id and a lease expiry
+    (epoch milliseconds) to the record. The lease is renewed while the task
+    runs; once it expires, any worker may take the record over. Records that
+    already carry any other status were settled and are never claimed again.
+    Bitable has no compare-and-set, so a claim is confirmed by reading the
+    record back after a short settle delay: when two workers race, only the
+    last writer keeps it.
+    """
+
+    WORKER_ID_FIELD = "worker_id"
+    LEASE_EXPIRES_AT_FIELD = "lease_expires_at"
+
+    def __init__(
+        self,
+        base_manager: BitableManager,
+        table_id: str,
+        worker_id: Optional[str] = None,
+        lease_seconds: float = 300,
+        settle_seconds: float = 1.0
+    ):
+        self.base_manager = base_manager
+        self.table_id = table_id
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid4().hex[:6]}"
+        self.lease_seconds = lease_seconds
+        self.renew_interval = lease_seconds / 3
+        self.settle_seconds = settle_seconds
+
+    def _lease_expiry(self) -> int:
+        return now_ms() + int(self.lease_seconds * 1000)
+
+    async def _get_fields(self, record_id: str):
+        # a lease decision must never reuse a read that started before a competing write
+        response = await self.base_manager.find_record(table_id=self.table_id, record_id=record_id, coalesce=False)
+        return response.data.record.fields or {}
+
+    def _claimable(self, fields) -> bool:
+        """a record is free when nobody touched it yet or its processing lease lapsed or is ours"""
+        status = fields.get("status") or ""
+        if status == "":
+            return True
+        if status != str(BubbleRecordStatus.PROCESSING):
+            # done, failed, invalid_url, ... was settled by someone, running it again would duplicate it
+            return False
+        owner = fields.get(self.WORKER_ID_FIELD)
+        expires_at = fields.get(self.LEASE_EXPIRES_AT_FIELD) or 0
+        return not owner or owner == self.worker_id or float(expires_at) <= now_ms()
+
+    async def claim(self, record_id: str) -> bool:
+        """try to take the lease on a record, returns False when it is held by another worker or already settled"""
+        try:
+            if not self._claimable(await self._get_fields(record_id)):
+                return False
+
+            await self.base_manager.update_record_async(
+                table_id=self.table_id,
+                record_id=record_id,
+                fields={
+                    "status": str(BubbleRecordStatus.PROCESSING),
+                    self.WORKER_ID_FIELD: self.worker_id,
+                    self.LEASE_EXPIRES_AT_FIELD: self._lease_expiry()
+                }
+            )
+
+            # let a competing claim land before checking who won
+            await asyncio.sleep(self.settle_seconds)
+
+            return (await self._get_fields(record_id)).get(self.WORKER_ID_FIELD) == self.worker_id
+        except Exception as err:
+            logger.error('failed to claim record %s: %s', record_id, err)
+            return False
+
+    async def renew(self, record_id: str) -> None:
+        await self.base_manager.update_record_async(
+            table_id=self.table_id,
+            record_id=record_id,
+            fields={
+                self.LEASE_EXPIRES_AT_FIELD: self._lease_expiry()
+            }
+        )
+
+    async def hold(self, record_id: str, until: float, no_of_retries: int) -> None:
+        """keep a failed record claimed until its retry is due (epoch seconds), so the backoff holds for every replica"""
+        try:
+            await self.base_manager.update_record_async(
+                table_id=self.table_id,
+                record_id=record_id,
+                fields={
+                    "no_of_retries": no_of_retries,
+                    self.LEASE_EXPIRES_AT_FIELD: int(until * 1000)
+                }
+            )
+        except Exception as err:
+            # the running lease still expires on its own, the retry just becomes visible earlier
+            logger.error('failed to hold record %s for its retry: %s', record_id, err)
+
+    async def release(self, record_id: str) -> None:
+        """hand an unfinished record back so it can be picked up again"""
+        try:
+            await self.base_manager.update_record_async(
+                table_id=self.table_id,
+                record_id=record_id,
+                fields={
+                    "status": "",
+                    self.WORKER_ID_FIELD: "",
+                    self.LEASE_EXPIRES_AT_FIELD: None
+                }
+            )
+        except Exception as err:
+            logger.error('failed to release record %s: %s', record_id, err)
+
+    async def keep_alive(self, record_id: str) -> None:
+        """renew the lease until cancelled"""
+        while True:
+            await asyncio.sleep(self.renew_interval)
+            try:
+                await self.renew(record_id)
+            except Exception as err:
+                logger.warning('failed to renew lease on record %s: %s', record_id, err)
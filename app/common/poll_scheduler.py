@@ -0,0 +1,56 @@
+import asyncio
+import random
+from .metrics import metrics
+
+
+class PollScheduler:
+    """Decides how long to wait between Worker.sync calls.
+
+    The interval doubles every time a sync comes back empty, up to max_interval,
+    and snaps back to min_interval as soon as a sync returns work. Each sleep is
+    randomized by +/- jitter so replicas started together drift apart.
+    """
+
+    def __init__(
+        self,
+        min_interval: float = 1.0,
+        max_interval: float = 60.0,
+        multiplier: float = 2.0,
+        jitter: float = 0.2
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.current_interval = min_interval
+        self._wake_event = asyncio.Event()
+        metrics.set_gauge('poll_interval_seconds', self.current_interval)
+
+    def reset(self) -> None:
+        self.current_interval = self.min_interval
+        metrics.set_gauge('poll_interval_seconds', self.current_interval)
+
+    def next_delay(self, found_items: int) -> float:
+        """returns the jittered delay before the next sync and advances the backoff"""
+        if found_items > 0:
+            self.reset()
+
+        delay = self.current_interval
+        if found_items == 0:
+            self.current_interval = min(self.current_interval * self.multiplier, self.max_interval)
+            metrics.set_gauge('poll_interval_seconds', self.current_interval)
+
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def wake(self) -> None:
+        """cut the current wait short, e.g. when a retry is due or the worker is stopping"""
+        self._wake_event.set()
+
+    async def idle(self, timeout: float) -> None:
+        """sleep for up to `timeout` seconds or until wake() is called"""
+        try:
+            await asyncio.wait_for(self._wake_event.wait(), timeout=max(0.0, timeout))
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._wake_event.clear()
@@ -0,0 +1,183 @@
+import asyncio
+import heapq
+import logging
+import random
+import time
+from typing import Dict, List, Optional, Tuple, Type
+import httpx
+from lark_oapi.api.bitable.v1 import AppTableRecord
+from groq import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+from app.src.lark import BitableManager
+from app.enums import BubbleRecordStatus
+from ._task import Task
+from .task_queue import TaskQueue
+from .poll_scheduler import PollScheduler
+
+logger = logging.getLogger()
+
+# (base delay, max delay) in seconds
+BackoffPolicy = Tuple[float, float]
+
+DEFAULT_POLICIES: List[Tuple[Type[BaseException], BackoffPolicy]] = [
+    (RateLimitError, (60, 1800)),
+    (asyncio.TimeoutError, (120, 1800)),
+    (APITimeoutError, (30, 900)),
+    (APIConnectionError, (15, 600)),
+    (InternalServerError, (15, 600)),
+]
+
+# failures that may go away on their own, handlers let these reach the executor instead of settling the record
+TRANSIENT_ERRORS: Tuple[Type[BaseException], ...] = (
+    RateLimitError, APITimeoutError, APIConnectionError, InternalServerError, asyncio.TimeoutError, httpx.HTTPError
+)
+
+
+class RetryScheduler:
+    """Re-queues failed tasks with exponential backoff.
+
+    A failed task is nacked back to the TaskQueue hidden until its retry is due,
+    and the due time goes on a timer heap; when it fires the poll scheduler is
+    woken so the task is picked up without waiting out the idle backoff.
+    Retry counts are written back to Lark in batches, and a task that used up
+    max_retries is marked failed; it stays tracked by the queue until that
+    status reached Lark, so a sync in between cannot queue it once more.
+    """
+
+    def __init__(
+        self,
+        task_queue: TaskQueue,
+        base_manager: BitableManager,
+        table_id: str,
+        poll_scheduler: Optional[PollScheduler] = None,
+        max_retries: int = 3,
+        policies: Optional[List[Tuple[Type[BaseException], BackoffPolicy]]] = None,
+        default_policy: BackoffPolicy = (30, 900),
+        flush_interval: float = 5.0
+    ):
+        self.task_queue = task_queue
+        self.base_manager = base_manager
+        self.table_id = table_id
+        self.poll_scheduler = poll_scheduler
+        self.max_retries = max_retries
+        self.policies = policies if policies is not None else DEFAULT_POLICIES
+        self.default_policy = default_policy
+        self.flush_interval = flush_interval
+        self._heap: List[Tuple[float, int, str]] = []
+        self._sequence = 0
+        self._pending_updates: Dict[str, Dict[str, object]] = {}
+        # exhausted tasks, acked once their failed status is written
+        self._pending_acks: Dict[str, Task] = {}
+        self._changed = asyncio.Event()
+
+    def backoff(self, err: BaseException, attempt: int) -> float:
+        base, cap = self.default_policy
+        for error_class, policy in self.policies:
+            if isinstance(err, error_class):
+                base, cap = policy
+                break
+
+        delay = min(cap, base * (2 ** max(0, attempt - 1)))
+        # full jitter on the upper half keeps retries of one burst from lining up
+        return random.uniform(delay / 2, delay)
+
+    def _push(self, due_at: float, task_uuid: str) -> None:
+        self._sequence += 1
+        heapq.heappush(self._heap, (due_at, self._sequence, task_uuid))
+        self._changed.set()
+
+    def restore(self) -> None:
+        """put retries that were already waiting in the queue back on the heap"""
+        for task_uuid, visible_at in self.task_queue.list_delayed():
+            self._push(visible_at, task_uuid)
+
+    def schedule(self, task: Task, err: BaseException) -> Optional[float]:
+        """schedule a retry for a failed task, returns when it is due (epoch seconds) or None when it has no retries left"""
+        task.increment_retry()
+        task.update_failed_at()
+
+        if task.record_id is not None:
+            self._pending_updates.setdefault(task.record_id, {})["no_of_retries"] = task.no_of_retries
+
+        if task.no_of_retries > self.max_retries:
+            logger.error('task %s failed %s times, giving up: %s', task.record_id, task.no_of_retries, err)
+            if task.record_id is not None:
+                self._pending_updates[task.record_id].update({
+                    "status": str(BubbleRecordStatus.FAILED),
+                    "worker_id": "",
+                    "lease_expires_at": None
+                })
+                self._pending_acks[task.record_id] = task
+            else:
+                self.task_queue.ack(task)
+            self._changed.set()
+            return None
+
+        delay = self.backoff(err, task.no_of_retries)
+        logger.warning(
+            'task %s failed (%s), retry %s/%s in %.0fs',
+            task.record_id, type(err).__name__, task.no_of_retries, self.max_retries, delay
+        )
+        due_at = time.time() + delay
+        self.task_queue.nack(task, delay=delay)
+        self._push(due_at, task.uuid)
+
+        return due_at
+
+    async def flush(self) -> None:
+        """write pending retry counts and statuses to Lark, 500 records per request"""
+        if not self._pending_updates:
+            return
+
+        pending, self._pending_updates = self._pending_updates, {}
+        records = [
+            AppTableRecord.builder().record_id(record_id).fields(fields).build()
+            for record_id, fields in pending.items()
+        ]
+
+        for start in range(0, len(records), 500):
+            chunk = records[start:start + 500]
+            try:
+                await self.base_manager.abatch_update_records(table_id=self.table_id, records=chunk)
+            except Exception as err:
+                logger.error('failed to write retry counts to lark: %s', err)
+                # keep the updates for the next flush unless newer ones replaced them
+                for record in chunk:
+                    self._pending_updates.setdefault(record.record_id, record.fields)
+                continue
+            except BaseException:
+                # cancelled mid-flush, this chunk and the unsent ones wait for the final flush
+                for record in records[start:]:
+                    self._pending_updates.setdefault(record.record_id, record.fields)
+                raise
+
+            for record in chunk:
+                task = self._pending_acks.pop(record.record_id, None)
+                if task is not None:
+                    self.task_queue.ack(task)
+
+    async def run(self) -> None:
+        """fire due retries and flush Lark updates until cancelled"""
+        last_flush = time.monotonic()
+        while True:
+            now = time.time()
+            fired = False
+            while self._heap and self._heap[0][0] <= now:
+                heapq.heappop(self._heap)
+                fired = True
+
+            if fired and self.poll_scheduler is not None:
+                self.poll_scheduler.wake()
+
+            if time.monotonic() - last_flush >= self.flush_interval:
+                await self.flush()
+                last_flush = time.monotonic()
+
+            timeout = self.flush_interval
+            if self._heap:
+                timeout = min(timeout, max(0.0, self._heap[0][0] - time.time()))
+
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,191 @@
+import logging
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Callable, Dict, Tuple
+from .metrics import metrics
+
+logger = logging.getLogger()
+
+
+@dataclass(frozen=True)
+class Shard:
+    """Slice of the Unprocessed records owned by one worker process"""
+    index: int
+    count: int
+
+    def owns(self, record_id: str) -> bool:
+        # crc32 is stable across processes, unlike the salted built-in hash()
+        return zlib.crc32(record_id.encode('utf-8')) % self.count == self.index
+
+
+def configure_child_logging(log_queue) -> None:
+    """send every log record of a worker process to the supervisor"""
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(QueueHandler(log_queue))
+
+
+def start_metrics_reporter(shard: Shard, metrics_queue, interval: float) -> threading.Thread:
+    """periodically push this process's metrics snapshot to the supervisor"""
+    def report():
+        while True:
+            time.sleep(interval)
+            try:
+                metrics_queue.put_nowait((shard.index, metrics.snapshot()))
+            except queue.Full:
+                pass
+
+    thread = threading.Thread(target=report, name='metrics-reporter', daemon=True)
+    thread.start()
+    return thread
+
+
+def start_metrics_logger(interval: float) -> threading.Thread:
+    """periodically log this process's metrics snapshot, the single worker counterpart of the supervisor's report"""
+    def report():
+        while True:
+            time.sleep(interval)
+            logger.info('worker metrics: %s', metrics.snapshot())
+
+    thread = threading.Thread(target=report, name='metrics-logger', daemon=True)
+    thread.start()
+    return thread
+
+
+class Supervisor:
+    """Runs N worker processes, restarts the ones that die and aggregates their logs and metrics.
+
+    `target` is called in each child as target(*args, shard, log_queue, metrics_queue)
+    and must be a module-level function because children are started with spawn.
+    """
+
+    def __init__(
+        self,
+        target: Callable[..., Any],
+        workers: int,
+        args: Tuple = (),
+        restart_delay: float = 1.0,
+        max_restart_delay: float = 60.0,
+        metrics_interval: float = 30.0,
+        stop_timeout: float = 60.0
+    ):
+        self.target = target
+        self.workers = workers
+        self.args = args
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.metrics_interval = metrics_interval
+        self.stop_timeout = stop_timeout
+        self._mp = multiprocessing.get_context('spawn')
+        self._processes: Dict[int, multiprocessing.Process] = {}
+        self._started_at: Dict[int, float] = {}
+        self._restart_at: Dict[int, float] = {}
+        self._delays: Dict[int, float] = {}
+        self._snapshots: Dict[int, Dict[str, Dict[str, float]]] = {}
+        self._stopping = False
+        self.log_queue = None
+        self.metrics_queue = None
+
+    def _start(self, index: int) -> None:
+        shard = Shard(index=index, count=self.workers)
+        process = self._mp.Process(
+            target=self.target,
+            args=(*self.args, shard, self.log_queue, self.metrics_queue),
+            name=f"worker-{index}",
+        )
+        process.start()
+        self._processes[index] = process
+        self._started_at[index] = time.monotonic()
+        logger.info('started worker %s (pid %s)', index, process.pid)
+
+    def _check_children(self) -> None:
+        now = time.monotonic()
+        for index, process in list(self._processes.items()):
+            if process.is_alive():
+                continue
+
+            if index not in self._restart_at:
+                delay = self._delays.get(index, self.restart_delay)
+                # a worker that stayed up for a while starts over with the shortest delay
+                if now - self._started_at[index] > self.max_restart_delay:
+                    delay = self.restart_delay
+                logger.error('worker %s exited with code %s, restarting in %.0fs', index, process.exitcode, delay)
+                self._restart_at[index] = now + delay
+                self._delays[index] = min(delay * 2, self.max_restart_delay)
+            elif now >= self._restart_at[index]:
+                del self._restart_at[index]
+                process.close()
+                self._start(index)
+
+    def _drain_metrics(self) -> None:
+        while True:
+            try:
+                index, snapshot = self.metrics_queue.get_nowait()
+            except queue.Empty:
+                return
+            self._snapshots[index] = snapshot
+
+    def aggregated_metrics(self) -> Dict[str, Any]:
+        """counters summed over all workers, gauges reported per worker"""
+        counters: Dict[str, float] = {}
+        gauges: Dict[str, float] = {}
+        for index, snapshot in sorted(self._snapshots.items()):
+            for name, value in snapshot.get('counters', {}).items():
+                counters[name] = counters.get(name, 0) + value
+            for name, value in snapshot.get('gauges', {}).items():
+                gauges[f"worker-{index}.{name}"] = value
+        return {"counters": counters, "gauges": gauges}
+
+    def stop(self, *_):
+        self._stopping = True
+
+    def run(self) -> None:
+        self.log_queue = self._mp.Queue()
+        self.metrics_queue = self._mp.Queue(maxsize=self.workers * 4)
+
+        listener = QueueListener(self.log_queue, *logging.getLogger().handlers, respect_handler_level=True)
+        listener.start()
+
+        signal.signal(signal.SIGTERM, self.stop)
+
+        try:
+            for index in range(self.workers):
+                self._start(index)
+
+            last_report = time.monotonic()
+            while not self._stopping:
+                self._check_children()
+                self._drain_metrics()
+
+                if time.monotonic() - last_report >= self.metrics_interval:
+                    logger.info('worker metrics: %s', self.aggregated_metrics())
+                    last_report = time.monotonic()
+
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._shutdown()
+            listener.stop()
+
+    def _shutdown(self) -> None:
+        logger.info('stopping %s workers...', len(self._processes))
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+
+        deadline = time.monotonic() + self.stop_timeout
+        for index, process in self._processes.items():
+            process.join(timeout=max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning('worker %s did not stop in time, killing it', index)
+                process.kill()
+                process.join()
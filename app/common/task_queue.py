@@ -1,33 +1,419 @@
+import json
+import os
+import sqlite3
+import time
 from dataclasses import dataclass, field
-from queue import Queue
-from typing import List, Dict, Any
+from threading import RLock
+from typing import List, Dict, Any, Optional, Set, Tuple
 from ._task import Task
-from datetime import datetime, timedelta
-# test
+from .metrics import metrics
+from datetime import datetime
+
 
 @dataclass
 class TaskQueue:
-    tasks: Queue = Queue()
+    """Durable task queue stored in a SQLite database (WAL mode).
+
+    Popped tasks stay in the database as "inflight" until they are acked, or
+    nacked back with an optional visibility delay. Tasks that were in flight
+    when the process died are queued again the next time the database is opened.
+
+    pop() is fair across uploaders (start-time fair queueing): each uploader is
+    a flow, serving one of its tasks costs 1 / priority of the task's
+    assessment type, and the uploader with the smallest start tag goes next.
+    Within one uploader tasks stay FIFO, and every assessment type queue keeps
+    its own fair queueing state. The same scheme runs across assessment types:
+    every pop of a type costs 1 / its priority, and turns() orders the types
+    so the dispatcher hands the next free slot to the one that is owed it.
+    """
+    # ids of a flow's head read at once, so a pop rarely needs an extra query
+    HEAD_BATCH = 32
+
+    path: str = os.path.join('storage', 'task_queue.db')
+    # weight per assessment type, missing types default to 1
+    priorities: Dict[str, float] = field(default_factory=dict)
+    # record_ids that are queued or still being processed
+    tracked_record_ids: Set[str] = field(default_factory=set)
+    _connection: Optional[sqlite3.Connection] = field(default=None, repr=False)
+    _lock: RLock = field(default_factory=RLock, repr=False)
+    # fair queueing state, kept separately for every assessment type queue
+    _virtual_time: Dict[Optional[str], float] = field(default_factory=dict, repr=False)
+    _finish_tags: Dict[Optional[str], Dict[str, float]] = field(default_factory=dict, repr=False)
+    # fair queueing state between assessment types
+    _type_virtual_time: float = field(default=0.0, repr=False)
+    _type_finish_tags: Dict[str, float] = field(default_factory=dict, repr=False)
+    # type -> uploaders that may have queued tasks of it, uploaders found empty are dropped by pop()
+    _flows: Dict[str, Set[str]] = field(default_factory=dict, repr=False)
+    # ids of the oldest visible tasks of each (type, uploader) flow, in order, read HEAD_BATCH at a time
+    _heads: Dict[Tuple[str, str], List[int]] = field(default_factory=dict, repr=False)
+    # when the earliest hidden task becomes visible, every cached head may be stale by then
+    _hidden_until: float = field(default=0.0, repr=False)
+    # uploader -> (tasks popped, total seconds spent waiting in the queue)
+    _wait_times: Dict[str, Tuple[int, float]] = field(default_factory=dict, repr=False)
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        # connect lazily so a queue can be configured before forking worker processes
+        if self._connection is None:
+            with self._lock:
+                if self._connection is None:
+                    self._connection = self._open()
+        return self._connection
+
+    def _open(self) -> sqlite3.Connection:
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                uuid TEXT NOT NULL UNIQUE,
+                record_id TEXT UNIQUE,
+                type TEXT NOT NULL,
+                uploader TEXT NOT NULL DEFAULT '',
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'queued',
+                no_of_retries INTEGER NOT NULL DEFAULT 0,
+                failed_at REAL,
+                visible_at REAL NOT NULL,
+                enqueued_at REAL NOT NULL
+            )
+            """
+        )
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(tasks)")}
+        if 'uploader' not in columns:
+            connection.execute("ALTER TABLE tasks ADD COLUMN uploader TEXT NOT NULL DEFAULT ''")
+
+        connection.execute("CREATE INDEX IF NOT EXISTS idx_tasks_state ON tasks (state, id)")
+        connection.execute("CREATE INDEX IF NOT EXISTS idx_tasks_uploader ON tasks (state, uploader, id)")
+        # head of one uploader's queue of one type, visible_at is read from the index
+        connection.execute("CREATE INDEX IF NOT EXISTS idx_tasks_flow ON tasks (state, type, uploader, id, visible_at)")
+
+        # anything left in flight belongs to a worker that is gone
+        connection.execute("UPDATE tasks SET state = 'queued' WHERE state = 'inflight'")
+
+        self.tracked_record_ids = {
+            row[0] for row in connection.execute("SELECT record_id FROM tasks WHERE record_id IS NOT NULL")
+        }
+        self._heads = {}
+        self._hidden_until = 0.0
+        self._flows = {}
+        for type, uploader in connection.execute("SELECT DISTINCT type, uploader FROM tasks"):
+            self._flows.setdefault(type, set()).add(uploader)
+
+        return connection
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    @staticmethod
+    def uploader_of(task: Task) -> str:
+        uploaded_by = task.payload.get('uploaded_by')
+        if isinstance(uploaded_by, list) and uploaded_by:
+            uploaded_by = uploaded_by[0]
+        if isinstance(uploaded_by, dict):
+            uploaded_by = uploaded_by.get('id')
+        return str(uploaded_by or '')
+
+    @staticmethod
+    def _to_row(task: Task, now: float):
+        return (
+            task.uuid,
+            task.record_id,
+            task.type,
+            TaskQueue.uploader_of(task),
+            json.dumps(task.payload),
+            task.no_of_retries,
+            task.failed_at.timestamp() if task.failed_at else None,
+            now,
+            now
+        )
+
+    @staticmethod
+    def _from_row(row) -> Task:
+        uuid, type, payload, no_of_retries, failed_at = row
+        return Task(
+            payload=json.loads(payload),
+            type=type,
+            uuid=uuid,
+            failed_at=datetime.fromtimestamp(failed_at) if failed_at else None,
+            no_of_retries=no_of_retries
+        )
+
+    def _insert(self, tasks: List[Task]) -> int:
+        """insert tasks in one transaction, skipping records that are already tracked"""
+        now = time.time()
+        connection = self.connection
+        with self._lock:
+            rows = []
+            added_record_ids = set()
+            for task in tasks:
+                if task.record_id is not None:
+                    if task.record_id in self.tracked_record_ids or task.record_id in added_record_ids:
+                        continue
+                    added_record_ids.add(task.record_id)
+                rows.append(self._to_row(task, now))
+
+            if not rows:
+                return 0
+
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.executemany(
+                    """
+                    INSERT OR IGNORE INTO tasks
+                        (uuid, record_id, type, uploader, payload, no_of_retries, failed_at, visible_at, enqueued_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    rows
+                )
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+
+            self.tracked_record_ids.update(added_record_ids)
+            for row in rows:
+                self._flows.setdefault(row[2], set()).add(row[3])
+                # new tasks queue behind every cached id, a short batch may have read the whole flow
+                heads = self._heads.get((row[2], row[3]))
+                if heads is not None and len(heads) < self.HEAD_BATCH:
+                    del self._heads[(row[2], row[3])]
+
+        return len(rows)
 
     def push(self, task: Task) -> None:
-        self.tasks.put(task)
+        self._insert([task])
+
+    def _read_heads(self, now: float, flow: Tuple[str, str]) -> List[int]:
+        """ids of the oldest visible tasks of one (type, uploader) flow, an index range read"""
+        type, uploader = flow
+        heads = [row[0] for row in self.connection.execute(
+            """
+            SELECT id FROM tasks INDEXED BY idx_tasks_flow
+            WHERE state = 'queued' AND type = ? AND uploader = ? AND visible_at <= ?
+            ORDER BY id LIMIT ?
+            """,
+            (type, uploader, now, self.HEAD_BATCH)
+        )]
+        if heads:
+            return heads
+
+        queued = self.connection.execute(
+            "SELECT 1 FROM tasks INDEXED BY idx_tasks_flow WHERE state = 'queued' AND type = ? AND uploader = ? LIMIT 1",
+            (type, uploader)
+        ).fetchone()
+        if queued is None:
+            # nack() and _insert() add the flow back when it gets tasks again
+            self._flows[type].discard(uploader)
+        return heads
+
+    def _next_uploader(self, now: float, assessment_type: Optional[str]) -> Optional[Tuple[str, float, int]]:
+        """pick the uploader with the smallest start tag among those with a ready task"""
+        if now >= self._hidden_until:
+            # a delayed task became visible, it may be older than the cached heads
+            self._heads.clear()
+            row = self.connection.execute(
+                "SELECT MIN(visible_at) FROM tasks WHERE state = 'queued' AND visible_at > ?", (now,)
+            ).fetchone()
+            self._hidden_until = row[0] if row[0] is not None else float('inf')
+
+        virtual_time = self._virtual_time.get(assessment_type, 0.0)
+        finish_tags = self._finish_tags.get(assessment_type, {})
+
+        types = [assessment_type] if assessment_type is not None else list(self._flows)
+        heads: Dict[str, int] = {}
+        for type in types:
+            for uploader in list(self._flows.get(type, ())):
+                flow = (type, uploader)
+                cached = self._heads.get(flow)
+                if cached is None:
+                    cached = self._heads[flow] = self._read_heads(now, flow)
+                if cached and (uploader not in heads or cached[0] < heads[uploader]):
+                    heads[uploader] = cached[0]
+
+        best = None
+        for uploader, head in heads.items():
+            tag = finish_tags.get(uploader, 0.0)
+            key = (tag if tag > virtual_time else virtual_time, head)
+            if best is None or key < best[0]:
+                best = (key, uploader)
+
+        if best is None:
+            return None
+        (start_tag, head), uploader = best
+        return uploader, start_tag, head
+
+    def pop(self, assessment_type: Optional[str] = None) -> Optional[Task]:
+        """atomically move the next visible task to inflight, returns None when nothing is ready.
+
+        With assessment_type set only that type's queue is considered.
+        """
+        connection = self.connection
+        now = time.time()
+        with self._lock:
+            selected = self._next_uploader(now, assessment_type)
+            if selected is None:
+                return None
+            uploader, start_tag, head = selected
+
+            row = connection.execute(
+                """
+                UPDATE tasks SET state = 'inflight'
+                WHERE id = ? AND state = 'queued'
+                RETURNING uuid, type, payload, no_of_retries, failed_at, enqueued_at
+                """,
+                (head,)
+            ).fetchone()
+
+            if row is None:
+                self._heads.clear()
+                return None
+
+            task = self._from_row(row[:5])
+            heads = self._heads.get((task.type, uploader))
+            if heads and heads[0] == head:
+                heads.pop(0)
+            if not heads:
+                # read the next batch on the next pop
+                self._heads.pop((task.type, uploader), None)
+
+            self._virtual_time[assessment_type] = start_tag
+            finish_tags = self._finish_tags.get(assessment_type, {})
+            finish_tags[uploader] = start_tag + 1 / self.priorities.get(task.type, 1)
+            # uploaders that fell behind the virtual clock have no credit left to keep
+            self._finish_tags[assessment_type] = {
+                key: tag for key, tag in finish_tags.items() if tag > start_tag
+            }
+
+            count, total = self._wait_times.get(uploader, (0, 0.0))
+            self._wait_times[uploader] = (count + 1, total + max(0.0, now - row[5]))
+
+            type_start = max(self._type_finish_tags.get(task.type, 0.0), self._type_virtual_time)
+            self._type_virtual_time = type_start
+            self._type_finish_tags[task.type] = type_start + 1 / self.priorities.get(task.type, 1)
+
+        return task
+
+    def turns(self, assessment_types: List[str]) -> List[str]:
+        """assessment types in the order they should get the next free slot, weighted by priority"""
+        with self._lock:
+            return sorted(
+                assessment_types,
+                key=lambda type: max(self._type_finish_tags.get(type, 0.0), self._type_virtual_time)
+            )
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """queue depth, oldest wait and average wait per uploader, also published as metrics"""
+        now = time.time()
+        with self._lock:
+            rows = self.connection.execute(
+                """
+                SELECT uploader, COUNT(*), MIN(enqueued_at) FROM tasks
+                WHERE state = 'queued'
+                GROUP BY uploader
+                """
+            ).fetchall()
+            wait_times = dict(self._wait_times)
+
+        stats = {}
+        for uploader, depth, oldest in rows:
+            stats[uploader] = {
+                "depth": depth,
+                "oldest_wait_seconds": round(now - oldest, 3)
+            }
+
+        for uploader, (count, total) in wait_times.items():
+            stats.setdefault(uploader, {"depth": 0, "oldest_wait_seconds": 0})
+            stats[uploader]["avg_wait_seconds"] = round(total / count, 3)
+
+        for uploader, values in stats.items():
+            for name, value in values.items():
+                metrics.set_gauge(f"queue.{uploader or 'unknown'}.{name}", value)
+
+        return stats
+
+    def ack(self, task: Task) -> None:
+        """remove a finished task so its record can be queued again by a later sync"""
+        connection = self.connection
+        with self._lock:
+            connection.execute("DELETE FROM tasks WHERE uuid = ?", (task.uuid,))
+            self.tracked_record_ids.discard(task.record_id)
+
+    def nack(self, task: Task, delay: float = 0) -> None:
+        """put an in-flight task back in the queue, hidden from pop for `delay` seconds"""
+        connection = self.connection
+        with self._lock:
+            connection.execute(
+                """
+                UPDATE tasks
+                SET state = 'queued', visible_at = ?, no_of_retries = ?, failed_at = ?
+                WHERE uuid = ?
+                """,
+                (
+                    time.time() + delay,
+                    task.no_of_retries,
+                    task.failed_at.timestamp() if task.failed_at else None,
+                    task.uuid
+                )
+            )
+            uploader = self.uploader_of(task)
+            self._flows.setdefault(task.type, set()).add(uploader)
+            # the task keeps its id, so it may go back in front of the cached heads
+            self._heads.pop((task.type, uploader), None)
+            if delay > 0:
+                self._hidden_until = min(self._hidden_until, time.time() + delay)
+
+    def remaining(self) -> int:
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM tasks WHERE state = 'queued'").fetchone()[0]
 
-    def pop(self) -> Task:
-        return self.tasks.get()
+    def enqueue_many(self, tasks: List[Dict[str, Any]]) -> int:
+        """queue records that are not already queued or in flight, returns how many were added"""
+        return self._insert([
+            Task(
+                payload=task,
+                type=task['assessment_type'],
+                no_of_retries=int(task.get('no_of_retries') or 0)
+            )
+            for task in tasks
+        ])
 
-    def remaining(self):
-        return self.tasks.qsize()
-    
-    def enqueue_many(self, tasks: List[Dict[str, Any]]):
-        for task in tasks:
-            type = task['assessment_type']
-            created_task = Task(payload=task, type=type)
-            self.tasks.put(created_task)
+    def is_tracked(self, record_id: str) -> bool:
+        return record_id in self.tracked_record_ids
 
-    def list_queued_items(self):
-        return list(self.tasks.queue)
-    
-    def is_empty(self) -> bool:
-        return self.tasks.empty()
+    def list_queued_items(self) -> List[Task]:
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT uuid, type, payload, no_of_retries, failed_at FROM tasks WHERE state = 'queued' ORDER BY id"
+            ).fetchall()
+        return [self._from_row(row) for row in rows]
 
+    def list_delayed(self) -> List[Tuple[str, float]]:
+        """uuid and visible_at of queued tasks that are still hidden"""
+        with self._lock:
+            return self.connection.execute(
+                "SELECT uuid, visible_at FROM tasks WHERE state = 'queued' AND visible_at > ?",
+                (time.time(),)
+            ).fetchall()
 
+    def is_empty(self, assessment_type: Optional[str] = None) -> bool:
+        """True when no task (of the given type) is ready to be popped right now"""
+        with self._lock:
+            row = self.connection.execute(
+                """
+                SELECT 1 FROM tasks
+                WHERE state = 'queued' AND visible_at <= ? AND (? IS NULL OR type = ?)
+                LIMIT 1
+                """,
+                (time.time(), assessment_type, assessment_type)
+            ).fetchone()
+        return row is None
@@ -1,6 +1,7 @@
 from typing import Dict
 import time
 import logging
+import httpx
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util import Retry
@@ -32,7 +33,7 @@ def create_session_with_retries(
     total_retries=3,
     backoff_factor=0.3,
     status_forcelist=[500, 502, 504],
-    method_whitelist=("GET", "POST")
+    allowed_methods=("GET", "POST")
 ):
     session = requests.Session()
 
@@ -40,7 +41,7 @@ def create_session_with_retries(
         total=total_retries,
         backoff_factor=backoff_factor,
         status_forcelist=status_forcelist,
-        method_whitelist=method_whitelist,
+        allowed_methods=allowed_methods,
         raise_on_status=True
     )
     adapter = HTTPAdapter(max_retries=retry_strategy)
@@ -50,17 +51,15 @@ def create_session_with_retries(
 
     return session
 
-def download_mp3(url, file_name):
+async def download_mp3(url, file_name, http_client):
     try:
-        # session = create_session_with_retries()
-        response = requests.get(url)
-        if response.status_code == 200:
-            with open(file_name, 'wb') as f:
-                f.write(response.content)
-    except requests.exceptions.InvalidURL as err:
-        raise requests.exceptions.InvalidURL("Provided url is invalid.")
-    except requests.exceptions.RequestException as err:
-        raise requests.exceptions.RequestException(f"Request failed: {err}")
+        response = await http_client.get(url)
+    except httpx.InvalidURL as err:
+        raise httpx.InvalidURL("Provided url is invalid.") from err
+    # other httpx errors propagate as they are, so the retry scheduler sees them as transient
+    if response.status_code == 200:
+        with open(file_name, 'wb') as f:
+            f.write(response.content)
 
 def map_value(value, lowest_value, max_value):
         return (value * max_value) + lowest_value
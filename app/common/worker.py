@@ -1,17 +1,21 @@
 import os
 from dataclasses import dataclass, asdict
 from datetime import datetime
+from typing import Dict, List, Optional, Union
+from lark_oapi.api.bitable.v1 import AppTableRecord
 from app.common import (DataTransformer,
-                        AppContext)
+                        AppContext,
+                        Shard)
 
 
 @dataclass
 class Worker:
     """Worker is responsible for processing applicant submission"""
 
-    def __init__(self, ctx: AppContext, server_task: str):
+    def __init__(self, ctx: AppContext, server_tasks: Union[str, List[str]], shard: Optional[Shard] = None):
         self._ctx = ctx
-        self.server_task = server_task
+        self.server_tasks = [server_tasks] if isinstance(server_tasks, str) else list(server_tasks)
+        self.shard = shard
 
     def create_storage_folders(self):
         """Create storage folder when running worker.py"""
@@ -19,8 +23,8 @@ class Worker:
         if not os.path.exists(temporary_storage_dir):
             os.makedirs(temporary_storage_dir)
 
-    async def sync(self):
-        """Synchronize items from lark to TaskQueue"""
+    async def sync(self) -> int:
+        """Synchronize items from lark to TaskQueue, returns the number of newly queued records"""
         # Get the current date and time
         now = datetime.now()
 
@@ -28,39 +32,29 @@ class Worker:
         formatted_time = now.strftime("%A at %I:%M %p")
 
         self._ctx.logger.info('🔄 syncing from lark at %s', formatted_time)
-        records = await self._ctx.lark_queue.get_items(self.server_task)
+        # only ask Lark for the columns the payloads keep
+        field_names = DataTransformer.field_names(
+            *(DataTransformer.columns_for(server_task) for server_task in self.server_tasks)
+        )
+        records = await self._ctx.lark_queue.get_items(self.server_tasks, field_names=field_names)
 
-        if len(records) == 0:
-            return
-
-        if self.server_task == "Content Generator":
-            transformed_records = DataTransformer.convert_raw_lark_record_to_dict(
-                records,
-                [
-                    "record_id",
-                    "version",
-                    "assessment_type",
-                    "environment",
-                    "youtube_link",
-                    "status",
-                    "date_uploaded",
-                    "uploaded_by"
-                ]
-            )
-        else: 
-            transformed_records = DataTransformer.convert_raw_lark_record_to_dict(
-                records,
-                [
-                    "record_id",
-                    "version",
-                    "assessment_type",
-                    "environment",
-                    "file",
-                    "download_url",
-                    "status",
-                    "date",
-                    "uploaded_by"
-                ]
-            )
+        if self.shard is not None:
+            records = [record for record in records if self.shard.owns(record.record_id)]
 
-        self._ctx.task_queue.enqueue_many(transformed_records)
+        if len(records) == 0:
+            return 0
+
+        # one sync serves every assessment type, split the records by type before transforming
+        records_by_type: Dict[str, List[AppTableRecord]] = {}
+        for record in records:
+            assessment_type = record.fields.get("assessment_type")
+            if assessment_type in self.server_tasks:
+                records_by_type.setdefault(assessment_type, []).append(record)
+
+        transformed_records = []
+        for assessment_type, typed_records in records_by_type.items():
+            columns = DataTransformer.columns_for(assessment_type)
+            transformed_records.extend(DataTransformer.convert_raw_lark_record_to_dict(typed_records, columns))
+
+        # records still queued or in flight from an earlier sync are skipped
+        return self._ctx.task_queue.enqueue_many(transformed_records)
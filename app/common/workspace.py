@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+from threading import Lock
+from .metrics import metrics
+
+
+class WorkspaceFull(Exception):
+    """A task wrote more to its workspace than it is allowed to"""
+
+
+def disk_usage(folder: str) -> int:
+    total = 0
+    for path, _, files in os.walk(folder):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(path, name))
+            except FileNotFoundError:
+                pass
+    return total
+
+
+class Workspace:
+    """Scratch directory owned by a single task, removed again by cleanup()"""
+
+    def __init__(self, folder: str, max_bytes: int = None):
+        self.folder = folder
+        self.max_bytes = max_bytes
+
+    def path(self, file_name: str) -> str:
+        return os.path.join(self.folder, file_name)
+
+    def check_usage(self) -> int:
+        """bytes in use, raises WorkspaceFull once the task went over max_bytes"""
+        usage = disk_usage(self.folder)
+        if self.max_bytes is not None and usage > self.max_bytes:
+            raise WorkspaceFull(f"{self.folder} uses {usage} bytes, limit is {self.max_bytes}")
+        return usage
+
+    def cleanup(self) -> None:
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def __enter__(self) -> "Workspace":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.cleanup()
+
+
+class WorkspaceManager:
+    """Hands out one Workspace per task below root.
+
+    Tasks running side by side never see each other's files. Workspaces left
+    behind by a crashed process are removed before the first new one is
+    created, so sharded workers point root at a folder of their own.
+    """
+
+    def __init__(self, root: str = os.path.join('storage', 'workspaces'), max_bytes_per_task: int = None):
+        self.root = root
+        self.max_bytes_per_task = max_bytes_per_task
+        self._purged = False
+        self._lock = Lock()
+
+    def _purge(self) -> None:
+        with self._lock:
+            if self._purged:
+                return
+            if os.path.isdir(self.root):
+                for name in os.listdir(self.root):
+                    shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+            os.makedirs(self.root, exist_ok=True)
+            self._purged = True
+
+    def create(self, name: str) -> Workspace:
+        self._purge()
+        folder = tempfile.mkdtemp(prefix=f"{name}-", dir=self.root)
+        metrics.increment('workspaces.created')
+        return Workspace(folder, max_bytes=self.max_bytes_per_task)
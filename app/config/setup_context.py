@@ -1,20 +1,38 @@
-from app.common import AppContext, LarkQueue, TaskQueue
+from app.common import AppContext, AttachmentCache, LarkQueue, TaskQueue, WorkspaceManager
 from .config import config
-from .setup_services import base_manager, file_manager, excel_reader, groq_service
+from .setup_services import base_manager, file_manager, groq_service, record_updates, http_client
 import logging
+import os
 from .setup_constants import base_constants
 from .setup_stores import stores
 context = AppContext(
     base_manager=base_manager,
     file_manager=file_manager,
-    excel_reader=excel_reader,
+    record_updates=record_updates,
+    http_client=http_client,
+    attachment_cache=AttachmentCache(
+        base_manager=base_manager,
+        folder=os.getenv('ATTACHMENT_CACHE_PATH', os.path.join('storage', 'attachments')),
+        max_bytes=int(os.getenv('ATTACHMENT_CACHE_MAX_BYTES', 1 << 30))
+    ),
+    workspaces=WorkspaceManager(
+        root=os.getenv('WORKSPACE_PATH', os.path.join('storage', 'workspaces')),
+        max_bytes_per_task=int(os.getenv('WORKSPACE_MAX_BYTES', 256 << 20))
+    ),
     lark_queue=LarkQueue(
         base_manager=base_manager,
         bitable_table_id=base_constants.UNPROCESSED_TABLE_ID,
         environment=config.ENVIRONMENT,
         version=config.VERSION,
+        # the same cap RetryScheduler gives up at, so released records below it are synced again
+        max_retries=int(os.getenv('MAX_RETRIES', 3)),
+        incremental=os.getenv('LARK_INCREMENTAL_SYNC', 'false').lower() in ('1', 'true', 'yes'),
+        modified_field=os.getenv('LARK_MODIFIED_FIELD', 'last_modified_time'),
+        reconcile_interval=float(os.getenv('LARK_RECONCILE_SECONDS', 600)),
+    ),
+    task_queue=TaskQueue(
+        path=os.getenv('TASK_QUEUE_PATH', os.path.join('storage', 'task_queue.db'))
     ),
-    task_queue=TaskQueue(),
     stores=stores,
     logger=logging.getLogger(),
     groq_service=groq_service,
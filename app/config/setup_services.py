@@ -1,26 +1,45 @@
-from app.src.lark import Lark, BitableManager, FileManager
-from app.services import ExcelReader, GroqService, APIManager
+from app.src.lark import Lark, BitableManager, FileManager, RecordUpdateBuffer, LarkRateLimiter, SingleFlight
+from app.services import GroqService, APIManager, HttpClient
 from app.config.config import config, groq_api_keys_manager
 from typing import Dict
+import os
 lark_client = Lark(
     app_id=config.APP_ID,
     app_secret=config.APP_SECRET,
     debug=True
 )
 
+# one connection pool for Okpo, attachment downloads and other plain HTTP calls
+http_client = HttpClient(
+    max_connections=int(os.getenv('HTTP_MAX_CONNECTIONS', 50)),
+    max_keepalive_connections=int(os.getenv('HTTP_MAX_KEEPALIVE_CONNECTIONS', 20)),
+    max_per_host=int(os.getenv('HTTP_MAX_PER_HOST', 10)),
+    keepalive_expiry=float(os.getenv('HTTP_KEEPALIVE_SECONDS', 30)),
+)
+
+# one limiter for every manager so they draw from the same Lark quota
+rate_limiter = LarkRateLimiter()
+single_flight = SingleFlight(ttl=float(os.getenv('LARK_READ_CACHE_SECONDS', 0)))
+
 base_manager = BitableManager(
     lark_client=lark_client,
     bitable_token=config.BITABLE_TOKEN,
-    bitable_id=config.UNPROCESSED_TABLE_ID
+    bitable_id=config.UNPROCESSED_TABLE_ID,
+    rate_limiter=rate_limiter,
+    single_flight=single_flight,
+    http_client=http_client
 )
 
+record_updates = RecordUpdateBuffer(base_manager=base_manager)
+
 file_manager = FileManager(
     lark_client=lark_client,
-    bitable_token=config.BITABLE_TOKEN
+    bitable_token=config.BITABLE_TOKEN,
+    http_client=http_client,
+    rate_limiter=rate_limiter,
+    single_flight=single_flight
 )
 
-excel_reader = ExcelReader(data_folder="storage/er")
-
 groq_service = GroqService(api_manager=groq_api_keys_manager)
 
 
@@ -1,10 +1,20 @@
-from app.stores import Stores, LarkDataStore, BubbleDataStore, ReferenceStore
-from .setup_services import base_manager
+import logging
+import os
+from app.stores import Stores, LarkDataStore, BubbleDataStore, ReferenceStore, TraineeStore
+from .setup_services import base_manager, record_updates
 from .setup_constants import base_constants
 
 stores = Stores(
     bubble_data_store=BubbleDataStore(
         base_manager=base_manager,
         table_id=base_constants.UNPROCESSED_TABLE_ID,
+        record_updates=record_updates,
+    ),
+    trainee_store=TraineeStore(
+        table_id=os.getenv("TRAINEES_TABLE_ID"),
+        base_manager=base_manager,
+        logger=logging.getLogger(),
+        ttl=float(os.getenv("TRAINEE_CACHE_TTL_SECONDS", 900)),
+        persist_path=os.getenv("TRAINEE_CACHE_PATH"),
     )
 )
\ No newline at end of file
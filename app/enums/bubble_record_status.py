@@ -1,6 +1,7 @@
 from enum import Enum
 
 class BubbleRecordStatus(Enum):
+    PROCESSING = "processing"
     DONE = "done"
     FAILED = "failed"
     FILE_DELETED = "file deleted"
@@ -3,4 +3,4 @@ class FileUploadError(Exception):
         self.code = code
         self.file_path = file_path
         self.message = message
-        super.__init__(f"File upload error: code={self.code}, message={self.message}, file_path={file_path}")
+        super().__init__(f"File upload error: code={self.code}, message={self.message}, file_path={file_path}")
@@ -2,4 +2,5 @@ from .excel_reader import ExcelReader
 from .api_manager import APIManager
 from .groq_service import GroqService
 from .trainee_evaluated_record_server import TraineeEvaluatedRecordService
+from .http_client import HttpClient
 from .okpo_endpoint import OkpoProcessEndpoint
\ No newline at end of file
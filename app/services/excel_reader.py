@@ -3,10 +3,12 @@
 import pandas as pd
 import os
 import json
+from app.stores.trainee_store import TraineeStore
 class ExcelReader:
-    def __init__(self, data_folder='storage/er'):
+    def __init__(self, data_folder='storage/er', file_path=None):
+        """one reader per task, it keeps the loaded dataframe of file_path as state"""
         self.data_folder = data_folder
-        self.file_path = self.find_file()
+        self.file_path = file_path or self.find_file()
         self.dataframe = None
 
     def find_file(self):
@@ -108,7 +110,11 @@ class ExcelReader:
         self.file_path = self.find_file()
         self.load_file()
             
-    def clean_and_process_file(self, ctx):
+    def clean_and_process_file(self, ctx, trainees=None):
+        """trainees is the index of TraineeStore, built here with the blocking client when not given.
+
+        Returns the trainee ids of the kept rows, in the order of the rewritten file.
+        """
         self.load_file()
         df = self.get_all_data()
 
@@ -133,41 +139,23 @@ class ExcelReader:
         try:
             # Step 3: Clean emails from the file
             df["Email_cleaned"] = df["Email"].str.strip().str.lower()
-            email_set = set(df["Email_cleaned"])
             # Step 4: Get trainee records from Lark base
-            table_id = os.getenv("TRAINEES_TABLE_ID")
-            lark_records = ctx.base_manager.get_records(table_id=table_id)
-
-            # Step 5: Extract en_names of matching emails
-            trainees = []
-            lark_emails = set()
-            for record in lark_records:
-                print(json.dumps(record.fields))
-                email = record.fields.get("lark.Work email")
-                if email:
-                    lark_emails.add(email.strip().lower())
-
-                
-                # Extract 'en_name' from inside the 'lark' list
-                lark_info = record.fields.get("lark", [])
-                name = None
-                if isinstance(lark_info, list) and lark_info:
-                    name = lark_info[0].get("en_name")
-                    id = lark_info[0].get("id")
-
-                if email and name and email.strip().lower() in email_set:
-                    trainees.append(id)
-
-            df = df[df["Email_cleaned"].isin(lark_emails)]
+            if trainees is None:
+                table_id = os.getenv("TRAINEES_TABLE_ID")
+                trainees = TraineeStore.build_index(ctx.base_manager.get_records(table_id=table_id))
+
+            # Step 5: Keep rows of known trainees and look up their ids
+            df = df[df["Email_cleaned"].isin(trainees.keys())]
+            trainee_ids = [trainees[email]["id"] for email in df["Email_cleaned"]]
             df.drop(columns=["Email_cleaned"], inplace=True)
 
             # ✅ Overwrite the file
             df.to_csv(self.file_path, index=False)
-            print(f"🔍 Trainees matched: {len(trainees)}")
+            print(f"🔍 Trainees matched: {len(trainee_ids)}")
 
 
         except Exception as e:
             print(f"❌ Failed during processing: {e}")
             return None
 
-        return trainees
+        return trainee_ids
@@ -35,5 +35,7 @@ class GroqService(ILLM):
 
             return completion.choices[0].message.content
         except Exception as err:
-            raise Exception(err) from err
+            # keep the groq error type, the retry scheduler backs off per error class
+            logger.error("groq chat failed: %s", err)
+            raise
 
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+from urllib.parse import urlsplit
+import httpx
+
+logger = logging.getLogger()
+
+
+class HttpClient:
+    """One pooled httpx.AsyncClient shared by every outbound HTTP call.
+
+    Connections are kept alive for keepalive_expiry seconds and reused, at
+    most max_per_host requests run against one host at a time, and every
+    request records whether it needed a new connection so stats() can show
+    how well the pool is reused. The client is created on first use, inside
+    the running event loop.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 50,
+        max_keepalive_connections: int = 20,
+        max_per_host: int = 10,
+        keepalive_expiry: float = 30.0,
+        connect_timeout: float = 10.0,
+        read_timeout: float = 60.0
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.max_per_host = max_per_host
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout, follow_redirects=True)
+        return self._client
+
+    def _slot(self, host: str) -> asyncio.Semaphore:
+        slot = self._host_slots.get(host)
+        if slot is None:
+            slot = self._host_slots[host] = asyncio.Semaphore(self.max_per_host)
+        return slot
+
+    def _tracer(self, host: str):
+        stats = self._stats.setdefault(host, {"requests": 0, "new_connections": 0})
+        stats["requests"] += 1
+
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            # httpcore reports every TCP connect, requests without one reused a pooled connection
+            if event_name == "connection.connect_tcp.complete":
+                stats["new_connections"] += 1
+
+        return trace
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs) -> AsyncIterator[httpx.Response]:
+        """send a request and keep the body unread, for large downloads"""
+        host = urlsplit(url).netloc
+        extensions = {**kwargs.pop("extensions", {}), "trace": self._tracer(host)}
+        async with self._slot(host):
+            async with self.client.stream(method, url, extensions=extensions, **kwargs) as response:
+                yield response
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        host = urlsplit(url).netloc
+        extensions = {**kwargs.pop("extensions", {}), "trace": self._tracer(host)}
+        async with self._slot(host):
+            return await self.client.request(method, url, extensions=extensions, **kwargs)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """requests, new connections and reused connections per host"""
+        return {
+            host: {**values, "reused_connections": max(0, values["requests"] - values["new_connections"])}
+            for host, values in self._stats.items()
+        }
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            logger.info('http connection reuse: %s', self.stats())
+            await self._client.aclose()
+            self._client = None
@@ -1,13 +1,14 @@
-from app.src.lark import BitableManager
+from app.src.lark import BitableManager, RecordUpdateBuffer
 
 
 class TraineeEvaluatedRecordService:
-    def __init__(self, base_manager: BitableManager):
+    def __init__(self, base_manager: BitableManager, record_updates: RecordUpdateBuffer):
         self.base_manager = base_manager
+        self.record_updates = record_updates
 
     async def update_number_of_retries(self, table_id: str, record_id: str, no_of_retries: int):
         try:
-            await self.base_manager.update_record_async(
+            await self.record_updates.update(
                 table_id=table_id,
                 record_id=record_id,
                 fields={
@@ -20,7 +21,7 @@ class TraineeEvaluatedRecordService:
     async def done_processing(self, table_id: str, record_id: str):
         """mark current record as done when the worker is done at processing it"""
         try:
-            await self.base_manager.update_record_async(
+            await self.record_updates.update(
                 table_id=table_id,
                 record_id=record_id,
                 fields={
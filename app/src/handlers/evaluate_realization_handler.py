@@ -1,52 +1,77 @@
+import asyncio
 import pandas as pd
 import os
 import re
 import json
+import uuid
+import hashlib
 from dotenv import load_dotenv
 from app.interfaces import CallbackHandler
-from app.common import AppContext
+from app.common import AppContext, Workspace, TRANSIENT_ERRORS
+from app.services import ExcelReader
 import requests
-from app.common.utilities import delete_file
-from typing import Dict
+from typing import Dict, List
+from lark_oapi.api.bitable.v1 import AppTableRecord
 load_dotenv('.env', override=True)
 
 class EvaluateRealization(CallbackHandler):
+    # Lark accepts at most 500 records per batch create
+    BATCH_SIZE = 500
+    BATCH_ATTEMPTS = 3
+
     def __init__(self, context: AppContext):
         self.ctx = context
-        self.excel_reader = self.ctx.excel_reader
+
+    @staticmethod
+    def batch_token(payload: Dict, start: int) -> str:
+        """client_token of the batch starting at row `start` of this upload, the same on every run"""
+        key = f"{payload['record_id']}:{payload['file'][0]['file_token']}:{start}"
+        return str(uuid.UUID(bytes=hashlib.md5(key.encode()).digest(), version=4))
+
+    async def insert_rows(self, table_id: str, rows: List[AppTableRecord], payload: Dict, offset: int = 0):
+        """write evaluated rows in batches, each batch is retried on its own before giving up.
+
+        offset is the position of rows[0] among all rows of the upload. Batch tokens derive
+        from it, so a retried task re-sending batches that already landed creates nothing new.
+        """
+        for start in range(0, len(rows), self.BATCH_SIZE):
+            chunk = rows[start:start + self.BATCH_SIZE]
+            client_token = self.batch_token(payload, offset + start)
+            for attempt in range(1, self.BATCH_ATTEMPTS + 1):
+                try:
+                    await self.ctx.base_manager.abatch_create_record(
+                        records=chunk,
+                        table_id=table_id,
+                        client_token=client_token
+                    )
+                    break
+                except Exception as err:
+                    if attempt == self.BATCH_ATTEMPTS:
+                        raise
+                    self.ctx.logger.warning(
+                        f"⚠️ Inserting rows {start}-{start + len(chunk) - 1} failed (attempt {attempt}): {err}"
+                    )
+                    await asyncio.sleep(2 ** attempt)
     
-    async def download_csv_from_payload(self, payload: Dict) -> str:
+    async def download_csv_from_payload(self, payload: Dict, workspace: Workspace) -> str:
         """
-        Downloads the attached CSV file from the Lark payload and saves it to ./storage/er/.
-        Skips download if file already exists.
+        Copies the attached CSV file from the attachment cache into the task's workspace,
+        downloading it from Lark only when its file_token has not been seen before.
         """
         try:
             self.ctx.logger.info("📥 Downloading Excel File")
             file_info = payload["file"][0]
             print(payload)
             file_name = f"data-{payload['uploaded_by'][0]['id']}.csv"
-            file_path = os.path.join("storage", "er", file_name)
-
-            if os.path.exists(file_path):
-                self.ctx.logger.info(f"📂 File already exists. Skipping download: {file_path}")
-                return file_path
-
-            file_token = file_info["file_token"]
-            record_id = payload["record_id"]
-
-            # Prepare payload
-            download_payload = {
-                "file_token": file_token,
-                "record_id": record_id
-            }
-
-            # Perform download
-            await self.ctx.base_manager.adownload(
-                payload=download_payload,
-                folder_name="storage/er",
-                file_name=file_name
+            file_path = workspace.path(file_name)
+
+            # a re-upload has a new file_token, so a cached copy is always the current file
+            await self.ctx.attachment_cache.copy_to(
+                file_token=file_info["file_token"],
+                record_id=payload["record_id"],
+                destination=file_path
             )
-            
+            workspace.check_usage()
 
             self.ctx.logger.info(f"✅ File downloaded successfully: {file_path}")
             return file_path
@@ -57,18 +82,25 @@ class EvaluateRealization(CallbackHandler):
 
     async def handler(self, payload: Dict[str, str]):
         self.ctx.logger.info("📝 Starting realization evaluation...")
+        # files and reader state of this task, jobs running side by side never share them
+        workspace = self.ctx.workspaces.create(f"er-{payload['record_id']}")
         try:
             # ✅ Step 1: Download if needed
-            generated_file = await self.download_csv_from_payload(payload=payload)
+            generated_file = await self.download_csv_from_payload(payload=payload, workspace=workspace)
 
-            names = self.excel_reader.clean_and_process_file(ctx=self.ctx)
-            self.excel_reader.refresh()
-            content = self.excel_reader.get_all_data()
+            excel_reader = ExcelReader(data_folder=workspace.folder, file_path=generated_file)
+            trainees = await self.ctx.stores.trainee_store.get_index()
+            names = excel_reader.clean_and_process_file(ctx=self.ctx, trainees=trainees)
+            excel_reader.refresh()
+            content = excel_reader.get_all_data()
             print(content)
             print("🚨 Payload being sent to Lark:", json.dumps(payload, indent=2))
 
             # ✅ Step 2: Loop through all rows
             if content is not None:
+                processed_table_id = os.getenv('PROCESSED_TABLE_ID')
+                rows: List[AppTableRecord] = []
+                inserted = 0
                 for index, row in content.iterrows():
                     try:
                         self.ctx.logger.info(f"➡️ Row {index}: {row.to_dict()}")
@@ -132,17 +164,27 @@ class EvaluateRealization(CallbackHandler):
                             "trainer": [{"id": payload["uploaded_by"][0]["id"]}]
                         }
 
-                        # ✅ Push to processed table
-                        self.ctx.base_manager.create_record(
-                            table_id=os.getenv('PROCESSED_TABLE_ID'),
-                            fields=fields_to_add
-                        )
+                        rows.append(AppTableRecord.builder().fields(fields_to_add).build())
 
+                    except TRANSIENT_ERRORS as row_err:
+                        # retry the whole task later rather than losing the row, batches already
+                        # written are not duplicated since their client tokens stay the same
+                        self.ctx.logger.error(f"❌ Row {index} failed, retrying the task later: {row_err}")
+                        raise
                     except Exception as row_err:
                         self.ctx.logger.error(f"❌ Skipping row {index} due to error: {row_err}")
+                        continue
+
+                    # ✅ Push full batches to processed table while the rest is evaluated
+                    if len(rows) >= self.BATCH_SIZE:
+                        await self.insert_rows(processed_table_id, rows, payload, offset=inserted)
+                        inserted += len(rows)
+                        rows = []
+
+                await self.insert_rows(processed_table_id, rows, payload, offset=inserted)
 
                 # ✅ Update unprocessed table record
-                self.ctx.base_manager.update_record(
+                await self.ctx.record_updates.update(
                     table_id=os.getenv('UNPROCESSED_TABLE_ID'),
                     record_id=payload['record_id'],
                     fields={"status": 'done'}
@@ -155,11 +197,10 @@ class EvaluateRealization(CallbackHandler):
 
         except Exception as e:
             self.ctx.logger.error(f"❌ Error during realization evaluation: {e}")
-        
+            # let the executor schedule a retry
+            raise
+
         finally:
-            print(generated_file)
-            if generated_file and os.path.exists(generated_file):
-                print(generated_file)
-                delete_file(generated_file)
+            workspace.cleanup()
             
             self.ctx.logger.info("✅ Finished realization evaluation.")
@@ -4,7 +4,7 @@ import re
 import json
 from dotenv import load_dotenv
 from app.interfaces import CallbackHandler
-from app.common import AppContext
+from app.common import AppContext, Workspace
 import requests
 from app.common.utilities import delete_file
 from typing import Dict
@@ -13,40 +13,26 @@ load_dotenv('.env', override=True)
 class EvaluateTrainees(CallbackHandler):
     def __init__(self, context: AppContext):
         self.ctx = context
-        self.excel_reader = self.ctx.excel_reader
     
-    async def download_csv_from_payload(self, payload: Dict) -> str:
+    async def download_csv_from_payload(self, payload: Dict, workspace: Workspace) -> str:
         """
-        Downloads the attached CSV file from the Lark payload and saves it to ./storage/er/.
-        Skips download if file already exists.
+        Copies the attached CSV file from the attachment cache into the task's workspace,
+        downloading it from Lark only when its file_token has not been seen before.
         """
         try:
             self.ctx.logger.info("📥 Downloading Excel File")
             file_info = payload["file"][0]
             print(payload)
             file_name = f"data-{payload['uploaded_by'][0]['id']}.csv"
-            file_path = os.path.join("storage", "er", file_name)
+            file_path = workspace.path(file_name)
 
-            if os.path.exists(file_path):
-                self.ctx.logger.info(f"📂 File already exists. Skipping download: {file_path}")
-                return file_path
-
-            file_token = file_info["file_token"]
-            record_id = payload["record_id"]
-
-            # Prepare payload
-            download_payload = {
-                "file_token": file_token,
-                "record_id": record_id
-            }
-
-            # Perform download
-            await self.ctx.base_manager.adownload(
-                payload=download_payload,
-                folder_name="storage/er",
-                file_name=file_name
+            # a re-upload has a new file_token, so a cached copy is always the current file
+            await self.ctx.attachment_cache.copy_to(
+                file_token=file_info["file_token"],
+                record_id=payload["record_id"],
+                destination=file_path
             )
-            
+            workspace.check_usage()
 
             self.ctx.logger.info(f"✅ File downloaded successfully: {file_path}")
             return file_path
@@ -9,7 +9,7 @@ import requests
 from typing import Dict
 from youtube_transcript_api import YouTubeTranscriptApi
 from app.services import OkpoProcessEndpoint
-import time
+import asyncio
 
 load_dotenv('.env', override=True)
 
@@ -24,6 +24,7 @@ class ContentGenerator(CallbackHandler):
         self.retrieve_run_endpoint = "https://okpo.com/version-test/api/1.1/wf/retrieve_run"
         self.retrieve_run_message_endpoint = "https://okpo.com/version-test/api/1.1/wf/retrieve_run_message"
         self.get_assistant_endpoint = "https://okpo.com/version-test/api/1.1/wf/get_assistant"
+        self.okpo = OkpoProcessEndpoint(http_client=context.http_client)
 
     def extract_video_id(self, url: str) -> str:
         match = re.search(r"(?:v=|\/)([0-9A-Za-z_-]{11})", url)
@@ -42,8 +43,18 @@ class ContentGenerator(CallbackHandler):
             youtube_url = payload['youtube_link']['text']
             print(youtube_url)
 
-            video_id = self.extract_video_id(youtube_url)
-            transcript = self.get_transcript(video_id)
+            try:
+                video_id = self.extract_video_id(youtube_url)
+            except ValueError as e:
+                # a malformed link never gets better, settle the record instead of retrying it
+                self.ctx.logger.error(f"❌ Invalid YouTube link {youtube_url}: {e}")
+                await self.ctx.record_updates.update(
+                    table_id=os.getenv('UNPROCESSED_TABLE_ID'),
+                    record_id=payload['record_id'],
+                    fields={"status": 'invalid_url'}
+                )
+                return
+            transcript = await asyncio.to_thread(self.get_transcript, video_id)
 
 
             # transcript_parts = []
@@ -65,14 +76,14 @@ class ContentGenerator(CallbackHandler):
             for idx in range(num_parts):
                 if thread_id:
                     # If thread exists, add a run message to the existing thread
-                    add_run_response = OkpoProcessEndpoint.add_run_message(self, message=f"send me part {idx + 1}", thread_id=thread_id)
+                    add_run_response = await self.okpo.add_run_message(message=f"send me part {idx + 1}", thread_id=thread_id)
                     print(f"add_run_message response for part {idx+1}:", add_run_response)
                     run_id = add_run_response['response'].get('run_id')
                     if not run_id:
                         raise Exception("Failed to retrieve run_id after adding run message.")
                 else:
                     # If thread does not exist, create a new thread and run, and save the thread_id
-                    response = OkpoProcessEndpoint.create_thread_and_run(self, message=f"Create the first part of the story")
+                    response = await self.okpo.create_thread_and_run(message=f"Create the first part of the story")
                     print(f"create_thread_and_run response for part {idx+1}:", response)
                     thread_id = response['response'].get('thread_id')
                     run_id = response['response'].get('run_id')
@@ -83,19 +94,19 @@ class ContentGenerator(CallbackHandler):
                 max_retries = 30
                 delay_seconds = 2
                 for attempt in range(max_retries):
-                    run_status_response = OkpoProcessEndpoint.retrieve_run(self, thread_id=thread_id, run_id=run_id)
+                    run_status_response = await self.okpo.retrieve_run(thread_id=thread_id, run_id=run_id)
                     print(f"retrieve_run response for part {idx+1}:", run_status_response)
                     status = run_status_response['response'].get('status')
                     if status == "completed":
                         break
                     elif status in ("failed", "cancelled"):
                         raise Exception(f"Run ended with status: {status}")
-                    time.sleep(delay_seconds)
+                    await asyncio.sleep(delay_seconds)
                 else:
                     raise Exception("Run did not complete in expected time.")
 
                 # Now retrieve the run message for this part and save it
-                message = OkpoProcessEndpoint.retrieve_run_message(self, thread_id=thread_id, run_id=run_id)
+                message = await self.okpo.retrieve_run_message(thread_id=thread_id, run_id=run_id)
                 print(f"Retrieved message for part {idx+1}:", message)
                 conversation_parts.append({
                     "part": idx + 1,
@@ -143,12 +154,12 @@ The transcript is broken into labeled parts:
                     "requestor": [{"id": payload["uploaded_by"][0]["id"]}]
                 }
 
-            self.ctx.base_manager.create_record(
+            await self.ctx.base_manager.create_record_async(
                 table_id=os.getenv('PROCESSED_TABLE_ID'),
                 fields=fields_to_add
             )
 
-            self.ctx.base_manager.update_record(
+            await self.ctx.record_updates.update(
                 table_id=os.getenv('UNPROCESSED_TABLE_ID'),
                 record_id=payload['record_id'],
                 fields={"status": 'done'}
@@ -157,11 +168,8 @@ The transcript is broken into labeled parts:
 
         except Exception as e:
             self.ctx.logger.error(f"❌ Error during realization evaluation: {e}")
-            self.ctx.base_manager.update_record(
-                table_id=os.getenv('UNPROCESSED_TABLE_ID'),
-                record_id=payload['record_id'],
-                fields={"status": 'invalid_url'}
-            )
+            # let the executor schedule a retry
+            raise
 
         finally:
             self.ctx.logger.info("✅ Finished realization evaluation.")
@@ -3,11 +3,14 @@ import os
 
 
 class Lark(lark.Client):
-    def __init__(self, app_id=None, app_secret=None, debug=False):
-     
+    def __init__(self, app_id=None, app_secret=None, debug=False, domain=lark.FEISHU_DOMAIN):
+        # open api base url, also used for requests made outside the sdk
+        self.domain = domain
+
         self.client = lark.Client.builder() \
             .app_id(app_id) \
             .app_secret(app_secret) \
+            .domain(domain) \
 
         if debug:
             self.client = self.client.log_level(lark.LogLevel.DEBUG)
@@ -1,17 +1,106 @@
+import asyncio
 import os
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional, Tuple
 import lark_oapi as lark
 from lark_oapi.api.auth.v3 import *
 from lark_oapi.core.const import UTF_8
 from .Lark import Lark
 import json
 
+
+@dataclass
+class _CachedToken:
+    token: Optional[str] = None
+    expires_at: float = 0.0
+    refreshing: Optional[Future] = None
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class TenantTokenCache:
+    """Tenant access tokens per app_id, shared by threads and event loops.
+
+    A token is refreshed in the background once it is within refresh_margin
+    seconds of expiring, while callers keep getting the current one. Callers
+    only wait when the token is missing or about to expire, and every caller
+    asking during a refresh waits on the same request.
+    """
+
+    def __init__(self, refresh_margin: float = 1200, expiry_margin: float = 60):
+        # keep refresh_margin under 30 minutes, Lark returns the old token until then
+        self.refresh_margin = refresh_margin
+        self.expiry_margin = expiry_margin
+        self._tokens: Dict[str, _CachedToken] = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, app_id: str) -> _CachedToken:
+        with self._lock:
+            return self._tokens.setdefault(app_id, _CachedToken())
+
+    def _refresh(self, entry: _CachedToken, fetch: Callable[[], Optional[Tuple[str, float]]]) -> Future:
+        with entry.lock:
+            if entry.refreshing is not None:
+                return entry.refreshing
+            future = entry.refreshing = Future()
+
+        def run():
+            try:
+                result = fetch()
+            except Exception as err:
+                lark.logger.error(f"refreshing tenant access token failed: {err}")
+                result = None
+
+            with entry.lock:
+                if result:
+                    token, expire = result
+                    entry.token, entry.expires_at = token, time.monotonic() + expire
+                entry.refreshing = None
+                valid = entry.token if time.monotonic() < entry.expires_at else None
+            future.set_result(valid)
+
+        threading.Thread(target=run, name="tenant-token-refresh", daemon=True).start()
+        return future
+
+    def _cached(self, entry: _CachedToken, fetch) -> Tuple[Optional[str], Optional[Future]]:
+        now = time.monotonic()
+        if entry.token and now < entry.expires_at - self.refresh_margin:
+            return entry.token, None
+
+        future = self._refresh(entry, fetch)
+        if entry.token and now < entry.expires_at - self.expiry_margin:
+            # still good for a while, the refresh finishes in the background
+            return entry.token, None
+        return None, future
+
+    def get(self, app_id: str, fetch: Callable[[], Optional[Tuple[str, float]]]) -> Optional[str]:
+        token, future = self._cached(self._entry(app_id), fetch)
+        return token if future is None else future.result()
+
+    async def aget(self, app_id: str, fetch: Callable[[], Optional[Tuple[str, float]]]) -> Optional[str]:
+        token, future = self._cached(self._entry(app_id), fetch)
+        return token if future is None else await asyncio.wrap_future(future)
+
+    def invalidate(self, app_id: str) -> None:
+        entry = self._entry(app_id)
+        with entry.lock:
+            entry.token, entry.expires_at = None, 0.0
+
+
+tenant_token_cache = TenantTokenCache()
+
+
 class TenantManager:
-    def __init__(self, lark_client: Lark):
+    def __init__(self, lark_client: Lark, token_cache: Optional[TenantTokenCache] = None):
         self.lark = lark_client.client
         self.APP_ID = os.getenv('APP_ID')
         self.APP_SECRET = os.getenv('APP_SECRET')
+        self.token_cache = token_cache or tenant_token_cache
 
-    def get_tenant_access_token(self):
+    def fetch_tenant_access_token(self) -> Optional[Tuple[str, float]]:
+        """request a new token from Lark, returns the token and its lifetime in seconds"""
         request: InternalTenantAccessTokenRequest = InternalTenantAccessTokenRequest.builder() \
             .request_body(InternalTenantAccessTokenRequestBody.builder() \
                           .app_id(self.APP_ID)
@@ -27,8 +116,11 @@ class TenantManager:
 
             return
         data = json.loads(response.raw.content.decode('UTF-8'))
-        # tenant_access_token = data["tenant_access_token"]
-        # print('data', data["tenant_access_token"])
-        # lark.logger.info(f"Get Tenant Token: {tenant_access_token}")
 
-        return data["tenant_access_token"]
\ No newline at end of file
+        return data["tenant_access_token"], data["expire"]
+
+    def get_tenant_access_token(self):
+        return self.token_cache.get(self.APP_ID, self.fetch_tenant_access_token)
+
+    async def aget_tenant_access_token(self):
+        return await self.token_cache.aget(self.APP_ID, self.fetch_tenant_access_token)
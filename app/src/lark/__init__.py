@@ -1,4 +1,8 @@
 from .Lark import Lark
+from .rate_limiter import LarkRateLimiter
+from .single_flight import SingleFlight
+from .media_uploader import MediaUploader
 from .bitable_manager import BitableManager
 from .file_manager import FileManager
-from .lark_messenger import LarkMessenger
\ No newline at end of file
+from .lark_messenger import LarkMessenger
+from .record_update_buffer import RecordUpdateBuffer
\ No newline at end of file
@@ -1,21 +1,78 @@
+import asyncio
+import hashlib
+import io
 import lark_oapi as lark
 from lark_oapi.api.bitable.v1 import *
 import os
 import json
+import tempfile
+from contextlib import asynccontextmanager
 from app.src.lark import Lark
 from lark_oapi.api.drive.v1 import *
+from typing import AsyncIterator, Callable, Optional, Tuple, TYPE_CHECKING
+from .rate_limiter import LarkRateLimiter, RECORD_LIST, RECORD_WRITE, BATCH, DRIVE
+from .single_flight import SingleFlight
+from .TenantManager import TenantManager
+from .media_uploader import MediaUploader
+
+if TYPE_CHECKING:
+    # app.services imports app.src.lark, only import it for annotations
+    from app.services.http_client import HttpClient
+
+# progress(bytes_downloaded, total_bytes or None)
+ProgressCallback = Callable[[int, Optional[int]], None]
+
+
+class DownloadTooLarge(Exception):
+    pass
 
 
 class BitableManager:
-    def __init__(self, lark_client: Lark, bitable_token=None, bitable_id=None):
+    # re-hosted attachments of unknown size are buffered in memory up to this size, then on disk
+    SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+
+    def __init__(self, lark_client: Lark, bitable_token=None, bitable_id=None,
+                 rate_limiter: Optional[LarkRateLimiter] = None, single_flight: Optional[SingleFlight] = None,
+                 http_client: Optional["HttpClient"] = None, tenant_manager: Optional[TenantManager] = None):
         self.lark = lark_client.client
+        self.domain = lark_client.domain
+        # attachments are streamed over http_client when given, otherwise read through the sdk
+        self.http_client = http_client
+        self.tenant_manager = tenant_manager or TenantManager(lark_client)
+        self.rate_limiter = rate_limiter or LarkRateLimiter()
+        # identical concurrent reads share one request, writes invalidate them
+        self.single_flight = single_flight or SingleFlight()
         self.BITABLE_TOKEN = bitable_token
         self.BITABLE_ID = bitable_id
+        self.uploader = MediaUploader(self.lark, bitable_token, rate_limiter=self.rate_limiter)
 
     def set_table_id(self, table_id):
         self.BITABLE_ID = table_id
 
-    async def find_record(self, table_id: str, record_id: str, with_shared_url: bool = True):
+    @staticmethod
+    def projection(field_names) -> str:
+        """field_names query value, Lark only returns these fields of each record"""
+        return json.dumps(list(field_names), ensure_ascii=False)
+
+    def invalidate(self, table_id: str, record_ids: Optional[List[str]] = None) -> None:
+        """forget coalesced reads of a table, of the given records and every listing"""
+        def stale(key) -> bool:
+            if key[0] not in ("record", "records") or key[1] != table_id:
+                return False
+            return key[0] == "records" or record_ids is None or key[2] in record_ids
+
+        self.single_flight.forget(stale)
+
+    async def find_record(self, table_id: str, record_id: str, with_shared_url: bool = True, coalesce: bool = True):
+        """get one record, concurrent calls for the same record share a request unless coalesce is off"""
+        if not coalesce:
+            return await self._find_record(table_id, record_id)
+        return await self.single_flight.do(
+            ("record", table_id, record_id),
+            lambda: self._find_record(table_id, record_id)
+        )
+
+    async def _find_record(self, table_id: str, record_id: str):
         request = GetAppTableRecordRequest.builder() \
             .app_token(self.BITABLE_TOKEN) \
             .table_id(table_id) \
@@ -23,7 +80,7 @@ class BitableManager:
             .with_shared_url(True) \
             .build()
         
-        response: GetAppTableRecordResponse = await self.lark.bitable.v1.app_table_record.aget(request)
+        response: GetAppTableRecordResponse = await self.rate_limiter.acall(RECORD_LIST, self.lark.bitable.v1.app_table_record.aget, request)
 
         if not response.success():
             raise Exception(f"bitable http request error: code={response.code} message={response.msg}")
@@ -34,7 +91,7 @@ class BitableManager:
 
 
     async def list_records(self, filter=None, page_token=None, text_field_as_array=False, display_formula_ref=False,
-                           page_size=100):
+                           page_size=100, field_names=None):
         partial_bitable_request = ListAppTableRecordRequest.builder() \
             .app_token(self.BITABLE_TOKEN) \
             .table_id(self.BITABLE_ID) \
@@ -43,6 +100,9 @@ class BitableManager:
             partial_bitable_request = partial_bitable_request.filter(filter) \
                 .text_field_as_array(text_field_as_array)
 
+        if field_names:
+            partial_bitable_request = partial_bitable_request.field_names(self.projection(field_names))
+
         if page_token:
             partial_bitable_request = partial_bitable_request.page_token(page_token=page_token)
 
@@ -50,7 +110,7 @@ class BitableManager:
 
         partial_bitable_request = partial_bitable_request.page_size(page_size).build()
 
-        response = await self.lark.bitable.v1.app_table_record.alist(partial_bitable_request)
+        response = await self.rate_limiter.acall(RECORD_LIST, self.lark.bitable.v1.app_table_record.alist, partial_bitable_request)
 
         if not response.success():
             raise Exception(f"Request failed: code={response.code}, msg={response.msg}, log_id={response.get_log_id()}")
@@ -59,7 +119,7 @@ class BitableManager:
         return response.data
 
     def sync_list_records(self, filter=None, page_token=None, text_field_as_array=False, display_formula_ref=False,
-                          page_size=100) -> ListAppTableRecordResponseBody:
+                          page_size=100, field_names=None) -> ListAppTableRecordResponseBody:
         partial_bitable_request = ListAppTableRecordRequest.builder() \
             .app_token(self.BITABLE_TOKEN) \
             .table_id(self.BITABLE_ID)
@@ -68,47 +128,54 @@ class BitableManager:
             partial_bitable_request = partial_bitable_request.filter(filter) \
                 .text_field_as_array(text_field_as_array)
 
+        if field_names:
+            partial_bitable_request = partial_bitable_request.field_names(self.projection(field_names))
+
         if page_token:
             partial_bitable_request = partial_bitable_request.page_token(page_token=page_token)
 
         partial_bitable_request = partial_bitable_request.display_formula_ref(display_formula_ref=display_formula_ref)
         partial_bitable_request = partial_bitable_request.page_size(page_size).build()
 
-        response = self.lark.bitable.v1.app_table_record.list(partial_bitable_request)
+        response = self.rate_limiter.call(RECORD_LIST, self.lark.bitable.v1.app_table_record.list, partial_bitable_request)
 
         if not response.success():
             raise Exception(f"Request failed: code={response.code}, msg={response.msg}, log_id={response.get_log_id()}")
 
         return response.data
 
-    def _get_records(self, table_id: str, filter=None, page_token=None, page_size=500):
+    def _get_records(self, table_id: str, filter=None, page_token=None, page_size=500, field_names=None):
         request = ListAppTableRecordRequest.builder() \
             .app_token(self.BITABLE_TOKEN) \
             .table_id(table_id)
         if filter:
             request = request.filter(filter)
+        if field_names:
+            request = request.field_names(self.projection(field_names))
         if page_token:
             request = request.page_token(page_token)
         request = request.page_size(page_size).build()
 
-        response = self.lark.bitable.v1.app_table_record.list(request)
+        response = self.rate_limiter.call(RECORD_LIST, self.lark.bitable.v1.app_table_record.list, request)
 
         if not response.success():
             raise Exception(f"Request failed: code={response.code}, msg={response.msg}, log_id={response.get_log_id()}")
 
         return response
     
-    async def async_get_records(self, table_id: str, filter=None, page_token=None, page_size=500):
+    async def async_get_records(self, table_id: str, filter=None, page_token=None, page_size=500, field_names=None):
         request = ListAppTableRecordRequest.builder() \
             .app_token(self.BITABLE_TOKEN) \
             .table_id(table_id)
         if filter:
             request = request.filter(filter)
+        if field_names:
+            request = request.field_names(self.projection(field_names))
         if page_token:
             request = request.page_token(page_token)
         request = request.page_size(page_size).build()
 
-        response = await self.lark.bitable.v1.app_table_record.alist(request)
+        response = await self.rate_limiter.acall(RECORD_LIST, self.lark.bitable.v1.app_table_record.alist, request)
         if not response.success():
             raise Exception(f"Request failed: code={response.code}, msg={response.msg}, log_id={response.get_log_id()}")
 
@@ -119,16 +186,85 @@ class BitableManager:
         return response.data.items  
     
 
-    def get_records(self, table_id, filter=None) -> List[AppTableRecord]:
+    async def _alist_page(self, table_id: str, filter=None, page_token=None, page_size=500, field_names=None):
+        request = ListAppTableRecordRequest.builder() \
+            .app_token(self.BITABLE_TOKEN) \
+            .table_id(table_id)
+        if filter:
+            request = request.filter(filter)
+        if field_names:
+            request = request.field_names(self.projection(field_names))
+        if page_token:
+            request = request.page_token(page_token)
+        request = request.page_size(page_size).build()
+
+        response = await self.rate_limiter.acall(RECORD_LIST, self.lark.bitable.v1.app_table_record.alist, request)
+        if not response.success():
+            raise Exception(f"Request failed: code={response.code}, msg={response.msg}, log_id={response.get_log_id()}")
+
+        return response.data
+
+    async def aiter_record_pages(self, table_id: str, filter=None, field_names=None,
+                                 page_size=500) -> AsyncIterator[List[AppTableRecord]]:
+        """
+        Streams every page of a table. The next page is requested while the caller
+        works on the current one, so at most two pages are held in memory.
+        """
+        next_page = asyncio.create_task(
+            self._alist_page(table_id, filter=filter, page_size=page_size, field_names=field_names)
+        )
+        try:
+            while next_page is not None:
+                data = await next_page
+                next_page = None
+
+                if data.has_more and data.page_token:
+                    next_page = asyncio.create_task(
+                        self._alist_page(table_id, filter=filter, page_token=data.page_token,
+                                         page_size=page_size, field_names=field_names)
+                    )
+
+                yield data.items or []
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+
+    async def aiter_records(self, table_id: str, filter=None, field_names=None,
+                            page_size=500) -> AsyncIterator[AppTableRecord]:
+        async for page in self.aiter_record_pages(table_id, filter=filter, field_names=field_names,
+                                                  page_size=page_size):
+            for record in page:
+                yield record
+
+    async def async_get_all_records(self, table_id: str, filter=None, field_names=None,
+                                    page_size=500) -> List[AppTableRecord]:
+        """async counterpart of get_records, follows has_more through every page.
+
+        Concurrent calls with the same arguments share one listing.
+        """
+        return await self.single_flight.do(
+            ("records", table_id, filter, tuple(field_names or ()), page_size),
+            lambda: self._async_get_all_records(table_id, filter, field_names, page_size)
+        )
+
+    async def _async_get_all_records(self, table_id: str, filter, field_names, page_size) -> List[AppTableRecord]:
+        records = []
+        async for page in self.aiter_record_pages(table_id, filter=filter, field_names=field_names,
+                                                  page_size=page_size):
+            records.extend(page)
+        return records
+
+    def get_records(self, table_id, filter=None, field_names=None) -> List[AppTableRecord]:
         has_more = True
         page_token = None
         records = []
 
         while has_more:
             if page_token:
-                response = self._get_records(filter=filter, page_token=page_token, table_id=table_id)
+                response = self._get_records(filter=filter, page_token=page_token, table_id=table_id,
+                                             field_names=field_names)
             else:
-                response = self._get_records(filter=filter, table_id=table_id)
+                response = self._get_records(filter=filter, table_id=table_id, field_names=field_names)
 
             has_more = response.data.has_more
             page_token = response.data.page_token if has_more else None
@@ -148,11 +284,13 @@ class BitableManager:
                     .build()) \
         .build()
 
-        response: CreateAppTableRecordResponse = await self.lark.bitable.v1.app_table_record.acreate(request)
+        response: CreateAppTableRecordResponse = await self.rate_limiter.acall(RECORD_WRITE, self.lark.bitable.v1.app_table_record.acreate, request)
 
         if not response.success():
             raise Exception(f"Request failed: code={response.code}, msg={response.msg}, log_id={response.get_log_id()}")
 
+        self.invalidate(table_id, record_ids=[])
+
         lark.logger.info(lark.JSON.marshal(response.data, indent=4))
         return response
 
@@ -165,11 +303,13 @@ class BitableManager:
                     .build()) \
         .build()
 
-        response: CreateAppTableRecordResponse = self.lark.bitable.v1.app_table_record.create(request)
+        response: CreateAppTableRecordResponse = self.rate_limiter.call(RECORD_WRITE, self.lark.bitable.v1.app_table_record.create, request)
 
         if not response.success():
             raise Exception(f"Request fasiled: code={response.code}, msg={response.msg}, log_id={response.get_log_id()}")
 
+        self.invalidate(table_id, record_ids=[])
+
         lark.logger.info(lark.JSON.marshal(response.data, indent=4))
         return response
     
@@ -183,11 +323,13 @@ class BitableManager:
                         .build()) \
             .build()
 
-        response: UpdateAppTableRecordResponse = self.lark.bitable.v1.app_table_record.update(request)
+        response: UpdateAppTableRecordResponse = self.rate_limiter.call(RECORD_WRITE, self.lark.bitable.v1.app_table_record.update, request)
 
         if not response.success():
             raise Exception(f"Request failed: code={response.code}, msg={response.msg}, log_id={response.get_log_id()}")
 
+        self.invalidate(table_id or self.BITABLE_ID, record_ids=[record_id])
+
         lark.logger.info(lark.JSON.marshal(response.data, indent=4))
         return response
     
@@ -201,11 +343,13 @@ class BitableManager:
                         .build()) \
             .build()
 
-        response: UpdateAppTableRecordResponse = await self.lark.bitable.v1.app_table_record.aupdate(request)
+        response: UpdateAppTableRecordResponse = await self.rate_limiter.acall(RECORD_WRITE, self.lark.bitable.v1.app_table_record.aupdate, request)
 
         if not response.success():
             raise Exception(f"Request failed: code={response.code}, msg={response.msg}, log_id={response.get_log_id()}")
 
+        self.invalidate(table_id or self.BITABLE_ID, record_ids=[record_id])
+
         lark.logger.info(lark.JSON.marshal(response.data, indent=4))
         return response
 
@@ -218,59 +362,183 @@ class BitableManager:
                           .build()) \
             .build()
 
-        response: BatchCreateAppTableRecordResponse = self.lark.bitable.v1.app_table_record.batch_create(request)
+        response: BatchCreateAppTableRecordResponse = self.rate_limiter.call(BATCH, self.lark.bitable.v1.app_table_record.batch_create, request)
 
         if not response.success():
             raise Exception(f"Request failed: code={response.code}, msg={response.msg}, log_id={response.get_log_id()}")
 
+        self.invalidate(self.BITABLE_ID, record_ids=[])
+
         lark.logger.info(lark.JSON.marshal(response.data, indent=4))
         return response
 
-    async def abatch_create_record(self, records):
-        request: BatchCreateAppTableRecordRequest = BatchCreateAppTableRecordRequest.builder() \
+    async def abatch_create_record(self, records, table_id: str = None, client_token: str = None):
+        """create up to 500 records in one request, retrying with the same client_token does not duplicate them"""
+        request = BatchCreateAppTableRecordRequest.builder() \
             .app_token(self.BITABLE_TOKEN) \
-            .table_id(self.BITABLE_ID) \
+            .table_id(table_id or self.BITABLE_ID)
+        if client_token:
+            request = request.client_token(client_token)
+        request: BatchCreateAppTableRecordRequest = request \
             .request_body(BatchCreateAppTableRecordRequestBody.builder()
                           .records(records)
                           .build()) \
             .build()
 
-        response: BatchCreateAppTableRecordResponse = await self.lark.bitable.v1.app_table_record.abatch_create(request)
+        response: BatchCreateAppTableRecordResponse = await self.rate_limiter.acall(BATCH, self.lark.bitable.v1.app_table_record.abatch_create, request)
 
         if not response.success():
             raise Exception(f"Request failed: code={response.code}, msg={response.msg}, log_id={response.get_log_id()}")
 
+        self.invalidate(table_id or self.BITABLE_ID, record_ids=[])
 
         lark.logger.info(lark.JSON.marshal(response.data, indent=4))
+        return response
 
-    async def adownload(self, payload, folder_name, file_name, destination_folder=None):
-        extra = {"bitablePerm": {"tableId": "tblvMKowaYr3FQPU",
-                                 "file": {"fldQeAROnz": {payload["record_id"]: [payload["file_token"]]}}}}
-        request: DownloadMediaRequest = DownloadMediaRequest.builder() \
-            .file_token(payload["file_token"]) \
-            .extra(json.dumps(extra)) \
+    async def abatch_update_records(self, table_id: str, records: List[AppTableRecord]):
+        """update up to 500 records in one request, each record needs record_id and fields"""
+        request: BatchUpdateAppTableRecordRequest = BatchUpdateAppTableRecordRequest.builder() \
+            .app_token(self.BITABLE_TOKEN) \
+            .table_id(table_id or self.BITABLE_ID) \
+            .request_body(BatchUpdateAppTableRecordRequestBody.builder()
+                          .records(records)
+                          .build()) \
             .build()
 
-        response: DownloadMediaResponse = await self.lark.drive.v1.media.adownload(request)
+        response: BatchUpdateAppTableRecordResponse = await self.rate_limiter.acall(BATCH, self.lark.bitable.v1.app_table_record.abatch_update, request)
+
         if not response.success():
             raise Exception(f"Request failed: code={response.code}, msg={response.msg}, log_id={response.get_log_id()}")
-            
+
+        self.invalidate(table_id or self.BITABLE_ID, record_ids=[record.record_id for record in records])
+
+        return response
+
+    async def download_media(self, file_token: str, extra) -> bytes:
+        """download an attachment, concurrent downloads of the same file_token share one request"""
+        async def fetch() -> bytes:
+            request: DownloadMediaRequest = DownloadMediaRequest.builder() \
+                .file_token(file_token) \
+                .extra(json.dumps(extra)) \
+                .build()
+
+            response: DownloadMediaResponse = await self.rate_limiter.acall(DRIVE, self.lark.drive.v1.media.adownload, request)
+            if not response.success():
+                raise Exception(f"Request failed: code={response.code}, msg={response.msg}, log_id={response.get_log_id()}")
+            return response.file.read()
+
+        # attachments can be large, share the download but never keep it around
+        return await self.single_flight.do(("media", file_token), fetch, ttl=0)
+
+    async def download_media_to_file(self, file_token: str, extra, destination: str, max_bytes: int = None,
+                                     progress: ProgressCallback = None, chunk_size: int = 1 << 20) -> Tuple[int, str]:
+        """
+        Streams an attachment to destination chunk by chunk, returns its size and sha256.
+        The file is written next to destination and moved in place once complete, and
+        DownloadTooLarge is raised as soon as it grows past max_bytes.
+        """
+        if self.http_client is None:
+            content = await self.download_media(file_token, extra)
+            if max_bytes is not None and len(content) > max_bytes:
+                raise DownloadTooLarge(f"{file_token} is {len(content)} bytes, limit is {max_bytes}")
+            await asyncio.to_thread(self._write_file, destination, content)
+            if progress:
+                progress(len(content), len(content))
+            return len(content), hashlib.sha256(content).hexdigest()
+
+        return await self.single_flight.do(
+            ("media-file", file_token, os.path.abspath(destination)),
+            lambda: self._stream_media(file_token, extra, destination, max_bytes, progress, chunk_size),
+            ttl=0
+        )
+
+    @staticmethod
+    def _write_file(destination: str, content: bytes) -> None:
+        folder = os.path.dirname(destination)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(destination, "wb") as f:
+            f.write(content)
+
+    @asynccontextmanager
+    async def _open_media(self, file_token, extra):
+        """open the download of an attachment over http_client, the body is still unread"""
+        token = await self.tenant_manager.aget_tenant_access_token()
+        url = f"{self.domain}/open-apis/drive/v1/medias/{file_token}/download"
+
+        await self.rate_limiter.aacquire(DRIVE)
+        async with self.http_client.stream(
+            "GET", url,
+            params={"extra": json.dumps(extra)},
+            headers={"Authorization": f"Bearer {token}"}
+        ) as response:
+            if response.status_code != 200:
+                body = await response.aread()
+                raise Exception(f"Request failed: status={response.status_code}, body={body[:500]!r}")
+            yield response
+
+    async def _stream_media(self, file_token, extra, destination, max_bytes, progress, chunk_size) -> Tuple[int, str]:
+        folder = os.path.dirname(destination)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        partial_path = f"{destination}.part"
+        digest = hashlib.sha256()
+        size = 0
+
+        def write(f, chunk: bytes) -> None:
+            f.write(chunk)
+            digest.update(chunk)
+
+        async with self._open_media(file_token, extra) as response:
+            total = response.headers.get("Content-Length")
+            total = int(total) if total is not None else None
+            if max_bytes is not None and total is not None and total > max_bytes:
+                raise DownloadTooLarge(f"{file_token} is {total} bytes, limit is {max_bytes}")
+
+            f = await asyncio.to_thread(open, partial_path, "wb")
+            try:
+                async for chunk in response.aiter_bytes(chunk_size):
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise DownloadTooLarge(f"{file_token} is over the {max_bytes} bytes limit")
+                    await asyncio.to_thread(write, f, chunk)
+                    if progress:
+                        progress(size, total)
+            except BaseException:
+                await asyncio.to_thread(f.close)
+                await asyncio.to_thread(os.remove, partial_path)
+                raise
+            await asyncio.to_thread(f.close)
+
+        await asyncio.to_thread(os.replace, partial_path, destination)
+        return size, digest.hexdigest()
+
+    @staticmethod
+    def media_extra(record_id: str, file_token: str, table_id: str = "tblvMKowaYr3FQPU") -> dict:
+        """bitablePerm extra that authorizes downloading an attachment of record_id"""
+        return {"bitablePerm": {"tableId": table_id,
+                                "file": {"fldQeAROnz": {record_id: [file_token]}}}}
+
+    async def adownload(self, payload, folder_name, file_name, destination_folder=None, max_bytes=None, progress=None):
+        extra = self.media_extra(payload["record_id"], payload["file_token"])
+
         if destination_folder:
             filename = f"/{destination_folder}/{file_name}"
         else:
             filename = f"./{folder_name}/{file_name}"
 
-        if os.path.exists(filename):
-            os.makedirs(filename)
+        size, sha256 = await self.download_media_to_file(
+            payload["file_token"], extra, filename, max_bytes=max_bytes, progress=progress
+        )
+        lark.logger.info(f"downloaded {payload['file_token']} to {filename} ({size} bytes, sha256 {sha256})")
+        return filename
 
-        f = open(filename, "wb")
-        f.write(response.file.read())
-        f.close()
-
-    async def upload_file_and_get_token(self, payload, folder="data") -> str:
+    async def upload_file_and_get_token(self, payload, folder="data", chunk_size: int = 1 << 20) -> str:
         """
-        Downloads a file using file_token from a record, then uploads it to Lark Drive
-        and returns a valid file_token for use in a Bitable 'Attachment' field.
+        Re-hosts a file attached to a record in Lark Drive and returns a valid file_token
+        for use in a Bitable 'Attachment' field. The download is piped straight into the
+        upload when its size is known, otherwise it is spooled in memory, and past
+        SPOOL_MAX_MEMORY in a temporary file under folder.
         """
         try:
             # Extract from payload
@@ -279,47 +547,30 @@ class BitableManager:
             file_name = payload["file"][0]["name"]
 
             # 1️⃣ Prepare download request
-            extra = {
-                "bitablePerm": {
-                    "tableId": os.getenv("UNPROCESSED_TABLE_ID"),
-                    "file": {
-                        "fldQeAROnz": {record_id: [file_token]}
-                    }
-                }
-            }
-
-            request = DownloadMediaRequest.builder() \
-                .file_token(file_token) \
-                .extra(json.dumps(extra)) \
-                .build()
-
-            # 2️⃣ Download file from Lark
-            response = await self.lark.drive.v1.media.adownload(request)
-            if not response.success():
-                raise Exception(f"[Download] Failed: {response.msg}")
-
-            # 3️⃣ Save locally
-            if not os.path.exists(folder):
-                os.makedirs(folder)
-
-            local_path = os.path.join(folder, file_name)
-            with open(local_path, "wb") as f:
-                f.write(response.file.read())
-
-            # 4️⃣ Upload to Lark Drive (as attachment)
-            with open(local_path, "rb") as f:
-                upload_request = UploadAllMediaRequest.builder() \
-                    .file_name(file_name) \
-                    .file_type("attachment") \
-                    .file(f) \
-                    .build()
-
-                upload_response = await self.lark.drive.v1.media.aupload_all(upload_request)
-
-                if not upload_response.success():
-                    raise Exception(f"[Upload] Failed: {upload_response.msg}")
-
-            return upload_response.data.file_token
+            extra = self.media_extra(record_id, file_token, table_id=os.getenv("UNPROCESSED_TABLE_ID"))
+
+            if self.http_client is None:
+                content = await self.download_media(file_token, extra)
+                return await self.uploader.upload_file(file_name, io.BytesIO(content), len(content))
+
+            os.makedirs(folder, exist_ok=True)
+            with tempfile.SpooledTemporaryFile(max_size=self.SPOOL_MAX_MEMORY, dir=folder) as spool:
+                async with self._open_media(file_token, extra) as response:
+                    # 2️⃣ Known size: every part is uploaded while the next one is downloaded
+                    total = response.headers.get("Content-Length")
+                    if total is not None and "Content-Encoding" not in response.headers:
+                        return await self.uploader.upload_stream(
+                            file_name, int(total), response.aiter_raw(chunk_size)
+                        )
+
+                    # 3️⃣ Unknown size: Lark wants the size up front, so buffer the file first
+                    async for chunk in response.aiter_bytes(chunk_size):
+                        await asyncio.to_thread(spool.write, chunk)
+
+                size = spool.tell()
+                spool.seek(0)
+                # 4️⃣ Upload to Lark Drive (as attachment)
+                return await self.uploader.upload_file(file_name, spool, size)
 
         except Exception as e:
             print(f"❌ Error in upload_file_and_get_token: {e}")
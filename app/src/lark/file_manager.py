@@ -2,26 +2,46 @@
 # Provides methods for uploading files to Lark Drive and downloading files from URLs
 # Uses rate limiting via semaphore to prevent overloading
 import datetime
+import json
 import time
 from lark_oapi.api.drive.v1 import *
 from .TenantManager import TenantManager
-from app.exceptions.file_upload_error import FileUploadError
 import os
 import asyncio
 from app.src.lark import Lark
-import requests
+from typing import Optional, TYPE_CHECKING
+from .rate_limiter import LarkRateLimiter
+from .single_flight import SingleFlight
+from .media_uploader import MediaUploader
+
+if TYPE_CHECKING:
+    # app.services imports app.src.lark, only import it for annotations
+    from app.services.http_client import HttpClient
 
 class FileManager:
-    def __init__(self, lark_client: Lark, bitable_token: str):
+    # upload ids stay valid for a day, older resume state is thrown away
+    RESUME_MAX_AGE = 20 * 60 * 60
+
+    def __init__(self, lark_client: Lark, bitable_token: str, http_client: "HttpClient",
+                 rate_limiter: Optional[LarkRateLimiter] = None, single_flight: Optional[SingleFlight] = None):
         # Initialize FileManager with Lark client and bitable token
         self.lark = lark_client.client
+        self.rate_limiter = rate_limiter or LarkRateLimiter()
+        self.single_flight = single_flight or SingleFlight()
+        self.http_client = http_client
         self.bitable_token = bitable_token
         self.recording_directory = "data"
+        self.uploader = MediaUploader(self.lark, bitable_token, rate_limiter=self.rate_limiter)
+        # parts of multipart uploads in flight at the same time, across all uploads
         self.semaphore = asyncio.Semaphore(4)
 
-    def download_url(self, url, file_name):
-        # Download a file from a URL and save it locally
-        response = requests.get(url)
+    async def download_url(self, url, file_name):
+        # Download a file from a URL over the shared connection pool and save it locally,
+        # concurrent downloads of the same url to the same file share one request
+        await self.single_flight.do(("url", url, file_name), lambda: self._download_url(url, file_name), ttl=0)
+
+    async def _download_url(self, url, file_name):
+        response = await self.http_client.get(url)
 
         if response.status_code == 200:
             with open(file_name, 'wb') as f:
@@ -34,105 +54,148 @@ class FileManager:
         # Check if file exists, return early if not
         if not os.path.exists(file_path):
             return
-            
-        # Extract just the filename from the full path
-        filename = os.path.split(file_path)[1]
 
-        # Get the file size in bytes
+        # Concurrent uploads of the same unchanged file share one request and its file token
+        stat = os.stat(file_path)
+        return await self.single_flight.do(
+            ("upload", os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns),
+            lambda: self._upload_async(file_path),
+            ttl=0
+        )
+
+    async def _upload_async(self, file_path):
+        # Get the file size in bytes, large files are uploaded in parts
         size = self.get_file_size(file_path)
+        if size > self.uploader.MULTIPART_THRESHOLD:
+            return await self.upload_multipart(file_path)
 
-        # Open the file in binary read mode
-        file = open(file_path, 'rb')
-
-        # Build the upload request object with:
-        # - filename: name of file to upload
-        # - parent_type: specify this is for bitable
-        # - parent_node: the bitable token for authentication
-        # - size: file size in bytes
-        # - file: the actual file object
-        request: UploadAllMediaRequest = UploadAllMediaRequest.builder() \
-            .request_body(UploadAllMediaRequestBody.builder()
-                .file_name(filename)
-                .parent_type("bitable_file")
-                .parent_node(self.bitable_token)
-                .size(size) \
-                .file(file) \
-                .build()) \
-            .build()
-
-        # Make async API call to upload the file
-        response: UploadAllMediaResponse = await self.lark.drive.v1.media.aupload_all(request)
-
-        # Check if upload failed (non-zero code means error)
-        if response.code != 0:
-            raise FileUploadError(
-                code=response.code, 
-                message=response.msg, 
-                file_path=file_path
-            )
-
-        # Return the file token that can be used to reference this file
-        return response.data.file_token
+        # Extract just the filename from the full path
+        filename = os.path.split(file_path)[1]
+
+        # Upload the file in one request, the file is closed again once it is sent
+        with open(file_path, 'rb') as file:
+            return await self.uploader.upload_all(filename, file, size)
 
     async def upload_async_copy(self, file_path):
-        # Copy of upload_async method, likely for redundancy or testing
+        # Kept for existing callers, same as upload_async
         if not os.path.exists(file_path):
             return
-        filename = os.path.split(file_path)[1]
-        file = open(file_path, 'rb')
-
-        size = self.get_file_size(file_path)
-
-        request: UploadAllMediaRequest = UploadAllMediaRequest.builder() \
-            .request_body(UploadAllMediaRequestBody.builder()
-                .file_name(filename)
-                .parent_type("bitable_file")
-                .parent_node(self.bitable_token)
-                .size(size)
-                .file(file)
-                .build()) \
-            .build()
-
-        response: UploadAllMediaResponse = await self.lark.drive.v1.media.aupload_all(request)
-
-        if response.code != 0:
-            raise FileUploadError(
-                code=response.code, 
-                message=response.msg, 
-                file_path=file_path
-            )
-
-        return response.data.file_token
+        return await self._upload_async(file_path)
+
+    async def upload_multipart(self, file_path):
+        """
+        Uploads file_path in the parts Lark asks for, at most self.semaphore parts at a time.
+        Every part is retried on its own, and finished parts are recorded in a
+        <file_path>.upload.json sidecar so a failed upload resumes where it stopped.
+        """
+        stat = os.stat(file_path)
+        state_path = f"{file_path}.upload.json"
+        state = self._load_upload_state(state_path, stat)
+        if state is None:
+            state = await self._prepare_upload(file_path, stat)
+            self._save_upload_state(state_path, state)
+
+        done = set(state["done"])
+
+        async def upload_part(seq: int):
+            async with self.semaphore:
+                await self._upload_part(file_path, state, seq)
+            done.add(seq)
+            state["done"] = sorted(done)
+            self._save_upload_state(state_path, state)
+
+        pending = [seq for seq in range(state["block_num"]) if seq not in done]
+        await asyncio.gather(*(upload_part(seq) for seq in pending))
+
+        file_token = await self.uploader.finish(file_path, state["upload_id"], state["block_num"])
+        os.remove(state_path)
+        return file_token
+
+    async def _prepare_upload(self, file_path, stat):
+        prepared = await self.uploader.prepare(os.path.split(file_path)[1], stat.st_size)
+        return self._upload_state(stat, prepared)
+
+    @staticmethod
+    def _upload_state(stat, prepared):
+        return {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "created_at": time.time(),
+            "upload_id": prepared.upload_id,
+            "block_size": prepared.block_size,
+            "block_num": prepared.block_num,
+            "done": []
+        }
+
+    async def _upload_part(self, file_path, state, seq):
+        def read():
+            with open(file_path, 'rb') as file:
+                file.seek(seq * state["block_size"])
+                return file.read(state["block_size"])
+
+        chunk = await asyncio.to_thread(read)
+        await self.uploader.upload_part(file_path, state["upload_id"], seq, chunk)
+
+    def _load_upload_state(self, state_path, stat):
+        # resume only an upload of the very same file that Lark still remembers
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if state.get("size") != stat.st_size or state.get("mtime_ns") != stat.st_mtime_ns:
+            return None
+        if time.time() - state.get("created_at", 0) > self.RESUME_MAX_AGE:
+            return None
+        return state
+
+    @staticmethod
+    def _save_upload_state(state_path, state):
+        partial_path = f"{state_path}.tmp"
+        with open(partial_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(partial_path, state_path)
 
     def upload(self, file_path):
-        # Synchronous version of file upload to Lark Drive
+        # Synchronous version of file upload to Lark Drive, large files are uploaded in parts
         if not os.path.exists(file_path):
             return
-        filename = os.path.split(file_path)[1]
-        file = open(file_path, 'rb')
-
         size = self.get_file_size(file_path)
+        if size > self.uploader.MULTIPART_THRESHOLD:
+            return self.upload_multipart_sync(file_path)
 
-        request: UploadAllMediaRequest = UploadAllMediaRequest.builder() \
-            .request_body(UploadAllMediaRequestBody.builder()
-                .file_name(filename)
-                .parent_type("bitable_file")
-                .parent_node(self.bitable_token)
-                .size(size)
-                .file(file)
-                .build()) \
-            .build()
-
-        response: UploadAllMediaResponse = self.lark.drive.v1.media.upload_all(request)
-
-        if response.code != 0:
-            raise FileUploadError(
-                code=response.code, 
-                message=response.msg, 
-                file_path=file_path
-            )
-
-        return response.data.file_token
+        filename = os.path.split(file_path)[1]
+        with open(file_path, 'rb') as file:
+            return self.uploader.upload_all_sync(filename, file, size)
+
+    def upload_multipart_sync(self, file_path):
+        """
+        Blocking upload_multipart: parts go up one after another, each retried on its own,
+        and resume from the same <file_path>.upload.json sidecar.
+        """
+        stat = os.stat(file_path)
+        state_path = f"{file_path}.upload.json"
+        state = self._load_upload_state(state_path, stat)
+        if state is None:
+            prepared = self.uploader.prepare_sync(os.path.split(file_path)[1], stat.st_size)
+            state = self._upload_state(stat, prepared)
+            self._save_upload_state(state_path, state)
+
+        done = set(state["done"])
+        with open(file_path, 'rb') as file:
+            for seq in range(state["block_num"]):
+                if seq in done:
+                    continue
+                file.seek(seq * state["block_size"])
+                chunk = file.read(state["block_size"])
+                self.uploader.upload_part_sync(file_path, state["upload_id"], seq, chunk)
+                done.add(seq)
+                state["done"] = sorted(done)
+                self._save_upload_state(state_path, state)
+
+        file_token = self.uploader.finish_sync(file_path, state["upload_id"], state["block_num"])
+        os.remove(state_path)
+        return file_token
 
     def get_file_size(self, filepath):
         # Get the size of a file in bytes
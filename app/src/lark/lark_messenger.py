@@ -1,9 +1,12 @@
+from typing import Optional
 from .Lark import Lark
+from .rate_limiter import LarkRateLimiter, IM
 from lark_oapi.api.im.v1 import CreateMessageRequest, CreateMessageResponse, CreateMessageRequestBody
 
 class LarkMessenger:
-    def __init__(self, lark: Lark) -> None:
+    def __init__(self, lark: Lark, rate_limiter: Optional[LarkRateLimiter] = None) -> None:
         self.client = lark.client
+        self.rate_limiter = rate_limiter or LarkRateLimiter()
     
     async def send_message_card_to_group_chat(self, group_chat_id: str, content: str):
         create_message_request: CreateMessageRequest = CreateMessageRequest.builder() \
@@ -17,7 +20,7 @@ class LarkMessenger:
             ) \
             .build()
         
-        response: CreateMessageResponse = await self.client.im.v1.message.acreate(create_message_request)
+        response: CreateMessageResponse = await self.rate_limiter.acall(IM, self.client.im.v1.message.acreate, create_message_request)
 
         if response.code != 0:
             raise Exception(f"Error: code={response.code}, message={response.msg}")
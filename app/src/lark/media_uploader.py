@@ -0,0 +1,205 @@
+import asyncio
+import io
+import logging
+import time
+import zlib
+from typing import AsyncIterator, IO, Optional
+from lark_oapi.api.drive.v1 import *
+from app.exceptions.file_upload_error import FileUploadError
+from .rate_limiter import LarkRateLimiter, DRIVE
+
+logger = logging.getLogger()
+
+
+class MediaUploader:
+    """Uploads media into a Bitable as attachments.
+
+    Files up to MULTIPART_THRESHOLD go up in a single upload_all request,
+    larger ones through upload_prepare / upload_part / upload_finish, where
+    every part is retried on its own. upload_stream() takes the content as
+    an async iterator of chunks, so a download can be piped into Drive
+    without ever holding more than a few parts in memory.
+    """
+
+    # Lark's single-shot upload_all takes at most 20MB
+    MULTIPART_THRESHOLD = 20 * 1024 * 1024
+    PART_ATTEMPTS = 3
+
+    def __init__(self, lark_client, bitable_token: str, rate_limiter: Optional[LarkRateLimiter] = None):
+        self.lark = lark_client
+        self.bitable_token = bitable_token
+        self.rate_limiter = rate_limiter or LarkRateLimiter()
+
+    def _upload_all_request(self, file_name: str, file: IO[bytes], size: int) -> UploadAllMediaRequest:
+        return UploadAllMediaRequest.builder() \
+            .request_body(UploadAllMediaRequestBody.builder()
+                .file_name(file_name)
+                .parent_type("bitable_file")
+                .parent_node(self.bitable_token)
+                .size(size)
+                .file(file)
+                .build()) \
+            .build()
+
+    def _prepare_request(self, file_name: str, size: int) -> UploadPrepareMediaRequest:
+        return UploadPrepareMediaRequest.builder() \
+            .request_body(MediaUploadInfo.builder()
+                .file_name(file_name)
+                .parent_type("bitable_file")
+                .parent_node(self.bitable_token)
+                .size(size)
+                .build()) \
+            .build()
+
+    @staticmethod
+    def _part_request(upload_id: str, seq: int, chunk: bytes) -> UploadPartMediaRequest:
+        return UploadPartMediaRequest.builder() \
+            .request_body(UploadPartMediaRequestBody.builder()
+                .upload_id(upload_id)
+                .seq(seq)
+                .size(len(chunk))
+                .checksum(str(zlib.adler32(chunk)))
+                .file(io.BytesIO(chunk))
+                .build()) \
+            .build()
+
+    @staticmethod
+    def _finish_request(upload_id: str, block_num: int) -> UploadFinishMediaRequest:
+        return UploadFinishMediaRequest.builder() \
+            .request_body(UploadFinishMediaRequestBody.builder()
+                .upload_id(upload_id)
+                .block_num(block_num)
+                .build()) \
+            .build()
+
+    @staticmethod
+    def _check(response, file_name: str):
+        if response.code != 0:
+            raise FileUploadError(code=response.code, message=response.msg, file_path=file_name)
+        return response.data
+
+    async def upload_all(self, file_name: str, file: IO[bytes], size: int) -> str:
+        request = self._upload_all_request(file_name, file, size)
+        response: UploadAllMediaResponse = await self.rate_limiter.acall(DRIVE, self.lark.drive.v1.media.aupload_all, request)
+        return self._check(response, file_name).file_token
+
+    async def prepare(self, file_name: str, size: int) -> UploadPrepareMediaResponseBody:
+        """start a multipart upload, Lark answers with the upload_id, block_size and block_num to use"""
+        request = self._prepare_request(file_name, size)
+        response: UploadPrepareMediaResponse = await self.rate_limiter.acall(DRIVE, self.lark.drive.v1.media.aupload_prepare, request)
+        return self._check(response, file_name)
+
+    async def upload_part(self, file_name: str, upload_id: str, seq: int, chunk: bytes) -> None:
+        for attempt in range(1, self.PART_ATTEMPTS + 1):
+            try:
+                request = self._part_request(upload_id, seq, chunk)
+                response: UploadPartMediaResponse = await self.rate_limiter.acall(DRIVE, self.lark.drive.v1.media.aupload_part, request)
+                self._check(response, file_name)
+                return
+            except Exception as err:
+                if attempt == self.PART_ATTEMPTS:
+                    raise
+                logger.warning('retrying part %s of %s (%s/%s): %s', seq, file_name, attempt, self.PART_ATTEMPTS, err)
+                await asyncio.sleep(2 ** attempt)
+
+    async def finish(self, file_name: str, upload_id: str, block_num: int) -> str:
+        request = self._finish_request(upload_id, block_num)
+        response: UploadFinishMediaResponse = await self.rate_limiter.acall(DRIVE, self.lark.drive.v1.media.aupload_finish, request)
+        return self._check(response, file_name).file_token
+
+    # blocking counterparts for callers without an event loop, parts go up one after another
+
+    def upload_all_sync(self, file_name: str, file: IO[bytes], size: int) -> str:
+        request = self._upload_all_request(file_name, file, size)
+        response: UploadAllMediaResponse = self.rate_limiter.call(DRIVE, self.lark.drive.v1.media.upload_all, request)
+        return self._check(response, file_name).file_token
+
+    def prepare_sync(self, file_name: str, size: int) -> UploadPrepareMediaResponseBody:
+        request = self._prepare_request(file_name, size)
+        response: UploadPrepareMediaResponse = self.rate_limiter.call(DRIVE, self.lark.drive.v1.media.upload_prepare, request)
+        return self._check(response, file_name)
+
+    def upload_part_sync(self, file_name: str, upload_id: str, seq: int, chunk: bytes) -> None:
+        for attempt in range(1, self.PART_ATTEMPTS + 1):
+            try:
+                request = self._part_request(upload_id, seq, chunk)
+                response: UploadPartMediaResponse = self.rate_limiter.call(DRIVE, self.lark.drive.v1.media.upload_part, request)
+                self._check(response, file_name)
+                return
+            except Exception as err:
+                if attempt == self.PART_ATTEMPTS:
+                    raise
+                logger.warning('retrying part %s of %s (%s/%s): %s', seq, file_name, attempt, self.PART_ATTEMPTS, err)
+                time.sleep(2 ** attempt)
+
+    def finish_sync(self, file_name: str, upload_id: str, block_num: int) -> str:
+        request = self._finish_request(upload_id, block_num)
+        response: UploadFinishMediaResponse = self.rate_limiter.call(DRIVE, self.lark.drive.v1.media.upload_finish, request)
+        return self._check(response, file_name).file_token
+
+    async def upload_stream(self, file_name: str, size: int, chunks: AsyncIterator[bytes], parts_in_flight: int = 2) -> str:
+        """
+        Uploads exactly size bytes read from chunks and returns the file token.
+        At most parts_in_flight parts are uploading while the next one is filled,
+        reading from chunks waits until one of them is done.
+        """
+        if size <= self.MULTIPART_THRESHOLD:
+            buffer = io.BytesIO()
+            async for chunk in chunks:
+                buffer.write(chunk)
+            if buffer.tell() != size:
+                raise ValueError(f"{file_name}: expected {size} bytes, got {buffer.tell()}")
+            buffer.seek(0)
+            return await self.upload_all(file_name, buffer, size)
+
+        prepared = await self.prepare(file_name, size)
+        slots = asyncio.Semaphore(parts_in_flight)
+        uploads = []
+
+        async def upload_part(seq: int, block: bytes) -> None:
+            try:
+                await self.upload_part(file_name, prepared.upload_id, seq, block)
+            finally:
+                slots.release()
+
+        async def submit(block: bytes) -> None:
+            await slots.acquire()
+            uploads.append(asyncio.ensure_future(upload_part(len(uploads), block)))
+
+        received = 0
+        buffer = bytearray()
+        try:
+            async for chunk in chunks:
+                received += len(chunk)
+                buffer += chunk
+                while len(buffer) >= prepared.block_size:
+                    block = bytes(buffer[:prepared.block_size])
+                    del buffer[:prepared.block_size]
+                    await submit(block)
+                # surface a failed part right away instead of downloading the rest
+                for upload in uploads:
+                    if upload.done() and upload.exception() is not None:
+                        raise upload.exception()
+            if buffer:
+                await submit(bytes(buffer))
+            await asyncio.gather(*uploads)
+        except BaseException:
+            for upload in uploads:
+                upload.cancel()
+            raise
+
+        if received != size or len(uploads) != prepared.block_num:
+            raise ValueError(f"{file_name}: expected {size} bytes in {prepared.block_num} parts, "
+                             f"got {received} bytes in {len(uploads)} parts")
+        return await self.finish(file_name, prepared.upload_id, prepared.block_num)
+
+    async def upload_file(self, file_name: str, file: IO[bytes], size: int, chunk_size: int = 1 << 20) -> str:
+        """upload an open file, read chunk by chunk off the event loop"""
+        async def chunks():
+            while True:
+                chunk = await asyncio.to_thread(file.read, chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+        return await self.upload_stream(file_name, size, chunks())
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger()
+
+# families of Lark OpenAPI calls that share one quota
+RECORD_LIST = "record_list"
+RECORD_WRITE = "record_write"
+BATCH = "batch"
+DRIVE = "drive"
+IM = "im"
+
+# requests per second and burst size, kept below the documented per-app limits
+DEFAULT_LIMITS: Dict[str, Tuple[float, float]] = {
+    RECORD_LIST: (15, 15),
+    RECORD_WRITE: (15, 15),
+    BATCH: (8, 8),
+    DRIVE: (4, 4),
+    IM: (4, 4),
+}
+
+# 99991400: app frequency limit, 1254290: bitable TooManyRequest, 1254291: bitable write conflict
+RATE_LIMIT_CODES = {99991400, 1254290, 1254291}
+
+
+@dataclass
+class TokenBucket:
+    """Token bucket that hands out reservations instead of rejecting callers.
+
+    Every acquire takes a token, possibly one that only refills in the future,
+    and gets back how long to sleep before using it, so waiting callers are
+    served in arrival order. The rate halves whenever Lark reports a limit and
+    creeps back to the configured rate on every success.
+    """
+    rate: float
+    capacity: float
+    min_rate: float = 0.5
+    recovery: float = 0.05
+    base_rate: float = field(init=False)
+    tokens: float = field(init=False)
+    updated_at: float = field(default_factory=time.monotonic)
+    blocked_until: float = 0.0
+
+    def __post_init__(self):
+        self.base_rate = self.rate
+        self.tokens = self.capacity
+
+    def reserve(self, now: float) -> float:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        self.tokens -= 1
+
+        wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def penalize(self, now: float, retry_after: Optional[float]) -> None:
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = min(self.tokens, 0)
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+
+    def reward(self) -> None:
+        if self.rate < self.base_rate:
+            self.rate = min(self.base_rate, self.rate + self.base_rate * self.recovery)
+
+
+class LarkRateLimiter:
+    """Client-side rate limiting shared by every Lark manager.
+
+    Each API family has its own token bucket. call()/acall() wait for a token,
+    run the SDK call and, when Lark answers with a frequency limit error or
+    HTTP 429, slow the family down, honour x-ogw-ratelimit-reset and try again
+    instead of handing the error to the caller.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[float, float]]] = None, max_attempts: int = 5):
+        self.max_attempts = max_attempts
+        self._buckets: Dict[str, TokenBucket] = {
+            family: TokenBucket(rate=rate, capacity=capacity)
+            for family, (rate, capacity) in {**DEFAULT_LIMITS, **(limits or {})}.items()
+        }
+        # one lock for sync and async callers, it is only held for bookkeeping
+        self._lock = threading.Lock()
+
+    def _bucket(self, family: str) -> TokenBucket:
+        bucket = self._buckets.get(family)
+        if bucket is None:
+            rate, capacity = DEFAULT_LIMITS[RECORD_LIST]
+            bucket = self._buckets.setdefault(family, TokenBucket(rate=rate, capacity=capacity))
+        return bucket
+
+    def _reserve(self, family: str) -> float:
+        with self._lock:
+            return self._bucket(family).reserve(time.monotonic())
+
+    def acquire(self, family: str) -> None:
+        delay = self._reserve(family)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def aacquire(self, family: str) -> None:
+        delay = self._reserve(family)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def retry_after(response: Any) -> Optional[float]:
+        """seconds to back off when the response is a rate limit rejection, None otherwise"""
+        raw = getattr(response, "raw", None)
+        status = getattr(raw, "status_code", None)
+        code = getattr(response, "code", None)
+        if status != 429 and code not in RATE_LIMIT_CODES:
+            return None
+
+        headers = getattr(raw, "headers", None) or {}
+        for name, value in headers.items():
+            if name.lower() == "x-ogw-ratelimit-reset":
+                try:
+                    return max(0.0, float(value))
+                except (TypeError, ValueError):
+                    break
+        return 1.0
+
+    def _settle(self, family: str, response: Any, attempt: int) -> Optional[float]:
+        """update the bucket from a response, returns the delay before a retry when rate limited"""
+        retry_after = self.retry_after(response)
+        with self._lock:
+            bucket = self._bucket(family)
+            if retry_after is None:
+                bucket.reward()
+                return None
+            bucket.penalize(time.monotonic(), retry_after)
+
+        if attempt >= self.max_attempts:
+            logger.error('lark %s still rate limited after %s attempts', family, attempt)
+            return None
+
+        logger.warning('lark %s rate limited (code=%s), retrying in %.1fs', family, getattr(response, "code", None), retry_after)
+        return retry_after
+
+    def call(self, family: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        for attempt in range(1, self.max_attempts + 1):
+            self.acquire(family)
+            response = fn(*args, **kwargs)
+            if self._settle(family, response, attempt) is None:
+                return response
+        return response
+
+    async def acall(self, family: str, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        for attempt in range(1, self.max_attempts + 1):
+            await self.aacquire(family)
+            response = await fn(*args, **kwargs)
+            if self._settle(family, response, attempt) is None:
+                return response
+        return response
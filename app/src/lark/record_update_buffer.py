@@ -0,0 +1,136 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+from lark_oapi.api.bitable.v1 import AppTableRecord
+from .bitable_manager import BitableManager
+
+logger = logging.getLogger()
+
+
+class RecordUpdateBuffer:
+    """Write-behind buffer for Bitable record updates.
+
+    Updates are merged per (table_id, record_id), later fields winning, and
+    sent with batch update requests of up to max_batch_size records. A flush
+    happens when max_batch_size records are pending or flush_interval seconds
+    after the first pending update, whichever comes first. Every caller gets a
+    future that resolves once its fields were written, or fails with the error
+    of the request that carried them.
+    """
+
+    def __init__(
+        self,
+        base_manager: BitableManager,
+        max_batch_size: int = 500,
+        flush_interval: float = 1.0
+    ):
+        self.base_manager = base_manager
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self._pending: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._waiters: Dict[Tuple[str, str], List[asyncio.Future]] = {}
+        self._timer: Optional[asyncio.Task] = None
+        self._flushing: Optional[asyncio.Task] = None
+        # created lazily, the buffer is built before the event loop exists
+        self._send_lock: Optional[asyncio.Lock] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def update_nowait(self, table_id: str, record_id: str, fields: Dict[str, Any]) -> asyncio.Future:
+        """merge fields into the pending update of a record and return a future for its write"""
+        key = (table_id, record_id)
+        self._pending.setdefault(key, {}).update(fields)
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, []).append(future)
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush_soon()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+        return future
+
+    async def update(self, table_id: str, record_id: str, fields: Dict[str, Any]) -> None:
+        """queue an update and wait until it was written to Lark"""
+        await self.update_nowait(table_id=table_id, record_id=record_id, fields=fields)
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        self._timer = None
+        await self.flush()
+
+    def _flush_soon(self) -> None:
+        if self._flushing is None or self._flushing.done():
+            self._flushing = asyncio.create_task(self.flush())
+
+    async def flush(self) -> None:
+        """send every pending update now"""
+        if self._send_lock is None:
+            self._send_lock = asyncio.Lock()
+
+        # batches go out one at a time so an older write never lands after a newer one
+        async with self._send_lock:
+            if not self._pending:
+                return
+
+            pending, self._pending = self._pending, {}
+            waiters, self._waiters = self._waiters, {}
+
+            by_table: Dict[str, List[str]] = {}
+            for table_id, record_id in pending:
+                by_table.setdefault(table_id, []).append(record_id)
+
+            for table_id, record_ids in by_table.items():
+                for start in range(0, len(record_ids), self.max_batch_size):
+                    chunk = record_ids[start:start + self.max_batch_size]
+                    await self._send(table_id, chunk, pending, waiters)
+
+    async def _send(self, table_id: str, record_ids: List[str], pending, waiters) -> None:
+        records = [
+            AppTableRecord.builder().record_id(record_id).fields(pending[(table_id, record_id)]).build()
+            for record_id in record_ids
+        ]
+
+        try:
+            await self.base_manager.abatch_update_records(table_id=table_id, records=records)
+        except Exception as err:
+            if len(records) == 1:
+                self._resolve(waiters.get((table_id, record_ids[0]), []), err)
+                return
+
+            # one bad record fails the whole batch, write the rest one by one
+            logger.warning('batch update of %s records failed, retrying them individually: %s', len(records), err)
+            for record_id in record_ids:
+                try:
+                    await self.base_manager.update_record_async(
+                        table_id=table_id,
+                        record_id=record_id,
+                        fields=pending[(table_id, record_id)]
+                    )
+                except Exception as record_err:
+                    self._resolve(waiters.get((table_id, record_id), []), record_err)
+                else:
+                    self._resolve(waiters.get((table_id, record_id), []))
+            return
+
+        for record_id in record_ids:
+            self._resolve(waiters.get((table_id, record_id), []))
+
+    @staticmethod
+    def _resolve(futures: List[asyncio.Future], err: Optional[BaseException] = None) -> None:
+        for future in futures:
+            if future.done():
+                continue
+            if err is None:
+                future.set_result(None)
+            else:
+                future.set_exception(err)
+
+    async def close(self) -> None:
+        """cancel the flush timer and write whatever is still pending"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self.flush()
@@ -0,0 +1,67 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Coalesces identical concurrent reads into one request.
+
+    Callers of do() with the same key while a call is in flight await that
+    call instead of starting their own; a caller being cancelled does not
+    cancel it for the others. With ttl > 0 the result is also kept for ttl
+    seconds. Results are shared between callers and must not be mutated.
+    forget() drops both in-flight calls and cached results, so a read issued
+    after a write never joins a read that started before it.
+    """
+
+    def __init__(self, ttl: float = 0.0, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self._results: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]], ttl: float = None) -> T:
+        ttl = self.ttl if ttl is None else ttl
+        cached = self._results.get(key)
+        if cached is not None:
+            expires_at, result = cached
+            if time.monotonic() < expires_at:
+                return result
+            del self._results[key]
+
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done, ttl))
+
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task, ttl: float) -> None:
+        # retrieve the outcome even when every caller went away
+        failed = task.cancelled() or task.exception() is not None
+
+        # a forget() may already have replaced or dropped this call
+        if self._in_flight.get(key) is not task:
+            return
+        del self._in_flight[key]
+
+        if ttl > 0 and not failed:
+            now = time.monotonic()
+            self._results[key] = (now + ttl, task.result())
+            self._results.move_to_end(key)
+            while self._results:
+                oldest_key, (expires_at, _) = next(iter(self._results.items()))
+                if expires_at > now and len(self._results) <= self.max_entries:
+                    break
+                del self._results[oldest_key]
+
+    def forget(self, predicate: Callable[[Hashable], bool]) -> None:
+        """drop in-flight calls and cached results whose key matches"""
+        for key in [key for key in self._in_flight if predicate(key)]:
+            del self._in_flight[key]
+        for key in [key for key in self._results if predicate(key)]:
+            del self._results[key]
@@ -1,4 +1,5 @@
 from .bubble_data_store import BubbleDataStore
 from .reference_store import ReferenceStore
+from .trainee_store import TraineeStore
 from ._stores import Stores
 from .lark_data_store import LarkDataStore
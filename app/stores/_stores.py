@@ -1,11 +1,13 @@
 from .lark_data_store import LarkDataStore
 from app.stores import BubbleDataStore, \
-    ReferenceStore
+    ReferenceStore, TraineeStore
 
 
 class Stores:
     def __init__(
         self,
         bubble_data_store: BubbleDataStore,
+        trainee_store: TraineeStore,
     ):
         self.bubble_data_store: BubbleDataStore = bubble_data_store
+        self.trainee_store: TraineeStore = trainee_store
@@ -1,12 +1,13 @@
 from typing import Literal
-from app.src.lark import BitableManager
+from app.src.lark import BitableManager, RecordUpdateBuffer
 
 
 class BubbleDataStore:
 
-    def __init__(self, table_id: str, base_manager: BitableManager):
+    def __init__(self, table_id: str, base_manager: BitableManager, record_updates: RecordUpdateBuffer):
         self.table_id: str = table_id
         self.base_manager: BitableManager = base_manager
+        self.record_updates: RecordUpdateBuffer = record_updates
 
     async def update_status(
         self,
@@ -14,7 +15,7 @@ class BubbleDataStore:
         status: Literal["done", "failed", "file deleted", "invalid audio url", "audio_less_than_30_secs", "script error"]
     ):
         try:
-            await self.base_manager.update_record_async(
+            await self.record_updates.update(
                 table_id=self.table_id,
                 record_id=record_id,
                 fields={
@@ -26,7 +27,7 @@ class BubbleDataStore:
 
     async def increment_retry(self, record_id: str, count: int):
         try:
-            await self.base_manager.update_record_async(
+            await self.record_updates.update(
                 table_id=self.table_id,
                 record_id=record_id,
                 fields={
@@ -38,7 +39,7 @@ class BubbleDataStore:
     
     async def get_unprocessed_items(self, filter):
         try:
-            response = await self.base_manager.async_get_records(
+            response = await self.base_manager.async_get_all_records(
                 self.table_id,
                 filter=filter
             )
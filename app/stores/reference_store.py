@@ -14,6 +14,9 @@ class ReferenceItemResponse(BaseModel):
 
 
 class ReferenceStore:
+    # the only fields read from the references table
+    COLUMNS = ["id", "content", "type", "script_id", "version"]
+
     def __init__(
         self,
         table_id: str,
@@ -32,11 +35,10 @@ class ReferenceStore:
         records: List[ReferenceItemResponse] = []
         self.logger.info("fetching references from lark...")
 
-        response = await self.base_manager.async_get_records(
+        async for item in self.base_manager.aiter_records(
             table_id=self.table_id,
-        )
-
-        for item in response:
+            field_names=self.COLUMNS,
+        ):
             id = str(item.fields.get("id")[0]["text"])
             print(f"{id}")
             content = item.fields.get("content")
@@ -0,0 +1,137 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, Iterable, Optional
+from lark_oapi.api.bitable.v1 import AppTableRecord
+from app.src.lark import BitableManager
+
+# normalized work email -> {"id": ..., "en_name": ...}
+TraineeIndex = Dict[str, Dict[str, Optional[str]]]
+
+
+class TraineeStore:
+    """Read-through cache of the trainees table, indexed by normalized work email.
+
+    get_index() serves the cached index while it is younger than ttl. An
+    expired index is still served while a background refresh replaces it;
+    only the very first call waits for Lark. With persist_path set the index
+    is written to disk after every refresh and loaded on start, so a restart
+    begins warm.
+    """
+
+    def __init__(
+        self,
+        table_id: str,
+        base_manager: BitableManager,
+        logger: logging.Logger,
+        ttl: float = 900,
+        persist_path: Optional[str] = None
+    ):
+        self.table_id = table_id
+        self.base_manager = base_manager
+        self.logger = logger
+        self.ttl = ttl
+        self.persist_path = persist_path
+        self._index: Optional[TraineeIndex] = None
+        self._fetched_at: float = 0.0
+        self._refreshing: Optional[asyncio.Task] = None
+        self._load()
+
+    @staticmethod
+    def normalize_email(email: str) -> str:
+        return email.strip().lower()
+
+    @staticmethod
+    def build_index(records: Iterable[AppTableRecord]) -> TraineeIndex:
+        index: TraineeIndex = {}
+        for record in records:
+            email = record.fields.get("lark.Work email")
+            if not email:
+                continue
+
+            # 'id' and 'en_name' live inside the 'lark' person field
+            lark_info = record.fields.get("lark", [])
+            trainee = {"id": None, "en_name": None}
+            if isinstance(lark_info, list) and lark_info:
+                trainee = {"id": lark_info[0].get("id"), "en_name": lark_info[0].get("en_name")}
+
+            index[TraineeStore.normalize_email(email)] = trainee
+        return index
+
+    def _load(self) -> None:
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._index = data["trainees"]
+            self._fetched_at = data["fetched_at"]
+            self.logger.info("loaded %s trainees from %s", len(self._index), self.persist_path)
+        except (OSError, ValueError, KeyError) as err:
+            self.logger.warning("ignoring trainee cache %s: %s", self.persist_path, err)
+
+    def _persist(self) -> None:
+        folder = os.path.dirname(self.persist_path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        tmp_path = f"{self.persist_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"fetched_at": self._fetched_at, "trainees": self._index}, f)
+        os.replace(tmp_path, self.persist_path)
+
+    async def refresh(self) -> TraineeIndex:
+        """download the trainees table, concurrent callers share one download"""
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.create_task(self._refresh())
+        return await asyncio.shield(self._refreshing)
+
+    async def _refresh(self) -> TraineeIndex:
+        self.logger.info("fetching trainees from lark...")
+        records = await self.base_manager.async_get_all_records(
+            table_id=self.table_id,
+            field_names=["lark", "lark.Work email"]
+        )
+
+        self._index = self.build_index(records)
+        # wall clock so the age of a persisted index survives a restart
+        self._fetched_at = time.time()
+
+        if self.persist_path:
+            try:
+                await asyncio.to_thread(self._persist)
+            except OSError as err:
+                self.logger.warning("failed to persist trainee cache: %s", err)
+
+        return self._index
+
+    def _refresh_in_background(self) -> None:
+        if self._refreshing is not None and not self._refreshing.done():
+            return
+
+        task = self._refreshing = asyncio.create_task(self._refresh())
+
+        def done(task: asyncio.Task):
+            if not task.cancelled() and task.exception() is not None:
+                self.logger.error("background trainee refresh failed: %s", task.exception())
+
+        task.add_done_callback(done)
+
+    async def get_index(self) -> TraineeIndex:
+        if self._index is None:
+            return await self.refresh()
+
+        if time.time() - self._fetched_at >= self.ttl:
+            self._refresh_in_background()
+        return self._index
+
+    async def find_by_email(self, email: str) -> Optional[Dict[str, Optional[str]]]:
+        index = await self.get_index()
+        return index.get(self.normalize_email(email))
+
+    def invalidate(self) -> None:
+        """drop the cached index, the next get_index() downloads the table again"""
+        self._index = None
+        self._fetched_at = 0.0
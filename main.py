@@ -1,9 +1,13 @@
 import asyncio
+import contextlib
 import json
 import os
 import argparse
-from typing import Dict
-from app.common import AppContext, Worker
+import logging
+import signal
+from typing import Dict, List, Optional
+from app.common import AppContext, Worker, TaskExecutor, PollScheduler, LeaseManager, RetryScheduler, Shard, Supervisor
+from app.common.supervisor import configure_child_logging, start_metrics_logger, start_metrics_reporter
 from app.src.handlers import EvaluateRealization, EvaluateTrainees, ContentGenerator
 from app.config.setup_context import context
 from app.interfaces import CallbackHandler
@@ -12,61 +16,113 @@ from app.config.initialize_dependencies import initialize_dependencies
 
 Handlers = Dict[str, CallbackHandler]
 
+task_map = {
+    "er": AssessmentType.EVALUATE_REALIZATION,
+    "et": AssessmentType.EVALUATE_TRAINEES,
+    "cg": AssessmentType.CONTENT_GENERATOR
+}
+
 async def main(
-        server_task: AssessmentType,
+        server_tasks: List[AssessmentType],
         ctx: AppContext,
         worker: Worker,
-        handlers: Handlers
+        executor: TaskExecutor,
+        poll_scheduler: PollScheduler,
+        retry_scheduler: RetryScheduler,
+        drain_timeout: float = 60
 ):
     
-    should_exit = False
+    should_exit = asyncio.Event()
 
-    await worker.sync()
+    def request_exit():
+        ctx.logger.info('shutdown requested, no longer syncing from lark')
+        should_exit.set()
+        poll_scheduler.wake()
 
-    ctx.logger.info('queue count: %s', ctx.task_queue.remaining())
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, request_exit)
 
-    while not should_exit:
-        try:
-            if not ctx.task_queue.is_empty():
-                ctx.logger.info('queue count: %s', ctx.task_queue.remaining())
-                task = ctx.task_queue.pop()
-                payload = task.payload
-                assessment_type = task.type
+    retry_scheduler.restore()
+    retry_runner = asyncio.create_task(retry_scheduler.run())
 
-                if(assessment_type == server_task):
-                    await handlers[assessment_type].handler(payload)
-            else:
-                await worker.sync()
-        except KeyboardInterrupt:
-            should_exit = True
+    next_sync_at = loop.time()
 
+    while not should_exit.is_set():
+        # hand the next free slot to the assessment type whose weighted turn it is
+        dispatched = False
+        for server_task in ctx.task_queue.turns(server_tasks):
+            if not executor.has_capacity(server_task):
+                continue
+            task = ctx.task_queue.pop(server_task)
+            if task is None:
+                continue
+            await executor.submit(task)
+            dispatched = True
+            break
 
-if __name__ == "__main__":
-    print("starting...")
-    parser = argparse.ArgumentParser(description='OkPo x Trainees Background processor')
-    parser.add_argument(
-        '--server-task',
-        type=str,
-        default='cg',
-        choices=['er', 'et', 'cg'],
-        help='Choose which task to run'
-    )
+        if dispatched:
+            ctx.logger.info('queue count: %s', ctx.task_queue.remaining())
+            continue
 
-    args = parser.parse_args()
+        if loop.time() >= next_sync_at:
+            try:
+                found_items = await worker.sync()
+            except Exception as err:
+                # a failed poll is an empty one, back off and try again instead of dropping buffered writes
+                ctx.logger.error('sync failed: %s', err)
+                found_items = 0
+            if found_items:
+                ctx.logger.info('queue stats: %s', ctx.task_queue.stats())
+            # back off while Lark has nothing new for us
+            next_sync_at = loop.time() + poll_scheduler.next_delay(found_items)
+            ctx.logger.debug('poll interval: %ss', poll_scheduler.current_interval)
+            continue
 
-    task_map = {
-        "er": AssessmentType.EVALUATE_REALIZATION,
-        "et": AssessmentType.EVALUATE_TRAINEES,
-        "cg": AssessmentType.CONTENT_GENERATOR
-    }
+        # nothing to do until a slot frees up, a retry comes due or the next sync
+        waiters = [asyncio.create_task(poll_scheduler.idle(next_sync_at - loop.time()))]
+        if executor.in_flight():
+            waiters.append(asyncio.create_task(executor.wait_for_any()))
+        _, pending = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+        for waiter in pending:
+            waiter.cancel()
+
+    # let running tasks finish, whatever is left goes back to the queue and Lark
+    await executor.shutdown(drain_timeout=drain_timeout)
 
+    retry_runner.cancel()
+    # a flush the runner was in the middle of hands its updates back before the final one
+    with contextlib.suppress(asyncio.CancelledError):
+        await retry_runner
+    await retry_scheduler.flush()
+    await ctx.record_updates.close()
+    await ctx.http_client.aclose()
+
+    ctx.logger.info('worker stopped, %s tasks left in queue', ctx.task_queue.remaining())
+    ctx.task_queue.close()
+
+
+def run(args: argparse.Namespace, shard: Optional[Shard] = None):
     # map shortcut name to its real name
-    server_task = task_map[args.server_task]
+    if args.server_task == 'all':
+        server_tasks = list(task_map.values())
+    else:
+        server_tasks = [task_map[args.server_task]]
 
-    print("Server task:", server_task)
+    print("Server task:", ", ".join(server_tasks))
 
     initialize_dependencies()
 
+    worker_id = args.worker_id
+    if shard is not None:
+        # every worker process keeps its own queue database and workspaces and claims records under its own id
+        base, extension = os.path.splitext(context.task_queue.path)
+        context.task_queue.path = f"{base}-{shard.index}{extension}"
+        context.workspaces.root = os.path.join(context.workspaces.root, f"shard-{shard.index}")
+        context.attachment_cache.folder = os.path.join(context.attachment_cache.folder, f"shard-{shard.index}")
+        if worker_id:
+            worker_id = f"{worker_id}-{shard.index}"
+
     # map handlers for all supported assessments
     handlers: Handlers = {
         AssessmentType.EVALUATE_REALIZATION: EvaluateRealization(context),
@@ -74,9 +130,146 @@ if __name__ == "__main__":
         AssessmentType.CONTENT_GENERATOR: ContentGenerator(context)
     }
 
-    worker = Worker(context, server_task)
+    # every realization job reads its roster from a workspace of its own, so they run side by side
+    # up to --concurrency unless ER_CONCURRENT_TASKS says otherwise
+    concurrency_limits = {
+        AssessmentType.EVALUATE_REALIZATION: int(os.getenv('ER_CONCURRENT_TASKS', args.concurrency))
+    }
+    for override in args.type_concurrency:
+        name, limit = override.split('=', 1)
+        concurrency_limits[task_map[name]] = int(limit)
+
+    for override in args.priority:
+        name, weight = override.split('=', 1)
+        context.task_queue.priorities[task_map[name]] = float(weight)
+
+    # claim rows before processing them so replicas can share the Unprocessed table
+    lease_manager = LeaseManager(
+        base_manager=context.base_manager,
+        table_id=os.getenv('UNPROCESSED_TABLE_ID'),
+        worker_id=worker_id,
+        lease_seconds=float(os.getenv('LEASE_SECONDS', 300))
+    )
+
+    print("Worker id:", lease_manager.worker_id)
+
+    poll_scheduler = PollScheduler(
+        min_interval=float(os.getenv('POLL_MIN_INTERVAL_SECONDS', 1)),
+        max_interval=float(os.getenv('POLL_MAX_INTERVAL_SECONDS', 60))
+    )
+
+    retry_scheduler = RetryScheduler(
+        task_queue=context.task_queue,
+        base_manager=context.base_manager,
+        table_id=os.getenv('UNPROCESSED_TABLE_ID'),
+        poll_scheduler=poll_scheduler,
+        max_retries=int(os.getenv('MAX_RETRIES', 3))
+    )
+
+    executor = TaskExecutor(
+        handlers=handlers,
+        limits=concurrency_limits,
+        default_limit=args.concurrency,
+        total_limit=args.total_concurrency,
+        task_timeout=args.task_timeout,
+        task_queue=context.task_queue,
+        lease_manager=lease_manager,
+        retry_scheduler=retry_scheduler
+    )
+
+    worker = Worker(context, server_tasks, shard=shard)
+
+    try:
+        asyncio.run(main(server_tasks, context, worker, executor, poll_scheduler, retry_scheduler, args.drain_timeout))
+    finally:
+        logging.shutdown()
+
+
+def run_worker(args: argparse.Namespace, shard: Shard, log_queue, metrics_queue):
+    """entry point of a worker process started by the supervisor"""
+    configure_child_logging(log_queue)
+    start_metrics_reporter(shard, metrics_queue, interval=float(os.getenv('METRICS_INTERVAL_SECONDS', 30)))
+    run(args, shard)
+
+
+if __name__ == "__main__":
+    print("starting...")
+    parser = argparse.ArgumentParser(description='OkPo x Trainees Background processor')
+    parser.add_argument(
+        '--server-task',
+        type=str,
+        default='cg',
+        choices=['er', 'et', 'cg', 'all'],
+        help='Choose which task to run, "all" serves every task from one combined sync'
+    )
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=int(os.getenv('MAX_CONCURRENT_TASKS', 4)),
+        help='Maximum number of tasks processed at the same time per assessment type'
+    )
+    parser.add_argument(
+        '--total-concurrency',
+        type=int,
+        default=int(os.getenv('MAX_TOTAL_CONCURRENT_TASKS', 0)) or None,
+        help='Maximum number of tasks processed at the same time across all assessment types'
+    )
+    parser.add_argument(
+        '--type-concurrency',
+        type=str,
+        nargs='*',
+        default=[],
+        metavar='TASK=LIMIT',
+        help='Override the concurrency limit of a single task, e.g. er=1 cg=8'
+    )
+    parser.add_argument(
+        '--priority',
+        type=str,
+        nargs='*',
+        default=[],
+        metavar='TASK=WEIGHT',
+        help='Share of free slots a task type gets while types compete for them (see --total-concurrency), e.g. cg=2'
+    )
+    parser.add_argument(
+        '--task-timeout',
+        type=float,
+        default=float(os.getenv('TASK_TIMEOUT_SECONDS', 0)) or None,
+        help='Seconds before a running task is cancelled, tasks run without a time limit by default'
+    )
+    parser.add_argument(
+        '--drain-timeout',
+        type=float,
+        default=float(os.getenv('SHUTDOWN_DRAIN_SECONDS', 60)),
+        help='Seconds running tasks get to finish on shutdown before they are requeued'
+    )
+    parser.add_argument(
+        '--worker-id',
+        type=str,
+        default=os.getenv('WORKER_ID'),
+        help='Identifier written on claimed records, defaults to <hostname>-<pid>-<random>'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=int(os.getenv('WORKERS', 1)),
+        help='Number of worker processes, records are sharded between them by record_id'
+    )
+
+    args = parser.parse_args()
 
-    asyncio.run(main(server_task, context, worker, handlers))
+    if args.workers > 1:
+        print("Workers:", args.workers)
+        supervisor = Supervisor(
+            target=run_worker,
+            workers=args.workers,
+            args=(args,),
+            metrics_interval=float(os.getenv('METRICS_INTERVAL_SECONDS', 30)),
+            stop_timeout=args.drain_timeout + 15
+        )
+        supervisor.run()
+    else:
+        start_metrics_logger(interval=float(os.getenv('METRICS_INTERVAL_SECONDS', 30)))
+        run(args)
                 
 # class Main:
 #     def __init__(self, ctx: AppContext):